@@ -0,0 +1,30 @@
+"""Multi-start L-BFGS-B fitting for likelihoods evaluated over batches of parameter sets.
+
+Shared by wcst_model.py and flanker_ddm.py. A log_likelihood here maps an
+(n, k) array of parameter sets to their n log-likelihoods, so the starting
+points and each finite-difference gradient cost one call each.
+"""
+import numpy as np
+from scipy.optimize import minimize
+
+grad_step = 1e-6
+
+
+def fit_starts(log_likelihood, starts, bounds, n_refine):
+    """Refine the n_refine best starting points; the best scipy result"""
+    start_ll = log_likelihood(starts)
+
+    def negative_ll(x):
+        # the point and its finite difference steps in one batched call;
+        # steps go inwards at the upper bounds
+        steps = np.where(x + grad_step > bounds[:, 1], -grad_step, grad_step)
+        points = np.vstack([x, x + np.diag(steps)])
+        ll = log_likelihood(points)
+        return -ll[0], -(ll[1:] - ll[0]) / steps
+
+    best = None
+    for i in np.argsort(-start_ll)[:n_refine]:
+        result = minimize(negative_ll, starts[i], jac=True, method='L-BFGS-B', bounds=bounds)
+        if best is None or result.fun < best.fun:
+            best = result
+    return best
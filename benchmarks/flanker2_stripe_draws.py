@@ -0,0 +1,65 @@
+"""Draw calls and CPU time per flanker2.py display: one visual.Line per stripe against one LineBatch
+
+Needs PsychoPy and a display. Run from the repository root: python benchmarks/flanker2_stripe_draws.py [n_displays]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from psychopy import visual
+
+from stripes import display_stripes
+from vertexbatch import LineBatch
+
+positions = [(-0.5, 0), (-0.25, 0), (0, 0), (0.25, 0), (0.5, 0)]
+
+
+def random_display():
+    center_tri, flank_tri = random.choice([True, False]), random.choice([True, False])
+    center_line = random.choice(['left', 'right'])
+    flank_line = random.choice(['left', 'right'])
+    return [(center_tri, center_line, pos) if i == 2 else (flank_tri, flank_line, pos)
+            for i, pos in enumerate(positions)]
+
+
+def main(n_displays=200):
+    random.seed(0)
+    win = visual.Window((800, 600), color='white', units='norm', waitBlanking=False)
+    displays = [display_stripes(items)[0] for items in (random_display() for _ in range(n_displays))]
+
+    lines = [[visual.Line(win, start=start, end=end, lineColor='black', lineWidth=3) for start, end in endpoints]
+             for endpoints in displays]
+    line_draws = 0
+    start = time.perf_counter()
+    for display in lines:
+        for line in display:
+            line.draw()
+        line_draws += len(display)
+        win.flip()
+    line_time = time.perf_counter() - start
+
+    batches = [LineBatch(win, endpoints, 3) for endpoints in displays]
+    start = time.perf_counter()
+    for batch in batches:
+        batch.draw()
+        win.flip()
+    batch_time = time.perf_counter() - start
+    batch_draws = sum(batch.n_draws for batch in batches)
+
+    start = time.perf_counter()
+    for endpoints in displays:
+        batches[0].set_lines(endpoints, 3)
+    build_time = time.perf_counter() - start
+    win.close()
+
+    print(f"stripe draw calls per display: {line_draws / n_displays:.1f} lines, {batch_draws / n_displays:.1f} batched "
+          f"(plus 5 shape draws either way)")
+    print(f"draw and flip per display: {line_time / n_displays * 1e3:.2f} ms lines, "
+          f"{batch_time / n_displays * 1e3:.2f} ms batched; rebuilding a batch {build_time / n_displays * 1e6:.0f} us")
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
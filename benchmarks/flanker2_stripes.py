@@ -0,0 +1,114 @@
+"""Cost of clipping the flanker2.py stripes: per-stripe loops against the batched stripes module
+
+Run from the repository root: python benchmarks/flanker2_stripes.py
+"""
+import os
+import random
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stripes import display_stripes, shape_stripes
+
+positions = [(-0.5, 0), (-0.25, 0), (0, 0), (0.25, 0), (0.5, 0)]
+
+
+# the geometry of make_shape_with_stripes before the stripes module, without
+# the visual.Line objects it wrapped each pair of endpoints in
+def legacy_segment_intersection(p1, p2, q1, q2):
+    A = np.array([[p2[0] - p1[0], q1[0] - q2[0]],
+                  [p2[1] - p1[1], q1[1] - q2[1]]])
+    b = np.array([q1[0] - p1[0], q1[1] - p1[1]])
+    try:
+        t, u = np.linalg.solve(A, b)
+        if 0 <= t <= 1 and 0 <= u <= 1:
+            return p1 + t * (p2 - p1)
+    except np.linalg.LinAlgError:
+        pass
+    return None
+
+
+def legacy_circle_line_intersections(center, radius, p1, p2):
+    d = p2 - p1
+    f = p1 - center
+    a = np.dot(d, d)
+    b = 2 * np.dot(f, d)
+    c = np.dot(f, f) - radius ** 2
+    discriminant = b ** 2 - 4 * a * c
+    if discriminant < 0:
+        return []
+    sqrt_disc = np.sqrt(discriminant)
+    t1 = (-b + sqrt_disc) / (2 * a)
+    t2 = (-b - sqrt_disc) / (2 * a)
+    return [p1 + t * d for t in [t1, t2]]
+
+
+def legacy_shape_stripes(is_triangle, line_direction, pos, size=0.1):
+    vertices = np.array([[-size, -size], [0, size * 1.5], [size, -size]])
+    stripes = []
+    spacing = 0.025
+    angle = np.pi / 4 if line_direction == 'left' else -np.pi / 4
+    direction = np.array([np.cos(angle), np.sin(angle)])
+    perp = np.array([-direction[1], direction[0]])
+    for i in range(8):
+        offset = (i - 4 + 0.5) * spacing
+        origin = np.array(pos) + offset * perp
+        line_start = origin - 2 * direction
+        line_end = origin + 2 * direction
+        if is_triangle:
+            abs_vertices = vertices + np.array(pos)
+            intersections = []
+            for j in range(3):
+                inter = legacy_segment_intersection(line_start, line_end, abs_vertices[j], abs_vertices[(j + 1) % 3])
+                if inter is not None:
+                    intersections.append(inter)
+            if len(intersections) == 2:
+                stripes.append(np.array(intersections))
+        else:
+            intersections = legacy_circle_line_intersections(np.array(pos), size, line_start, line_end)
+            if len(intersections) == 2:
+                stripes.append(np.array(intersections))
+    return stripes
+
+
+def random_display():
+    trial_type = random.choice(['shape', 'line'])
+    center_tri = random.choice([True, False])
+    center_line = random.choice(['left', 'right'])
+    if trial_type == 'shape':
+        flank_tri, flank_line = not center_tri, center_line
+    else:
+        flank_tri, flank_line = random.choice([True, False]), 'right' if center_line == 'left' else 'left'
+    return [(center_tri, center_line, pos) if i == 2 else (flank_tri, flank_line, pos)
+            for i, pos in enumerate(positions)]
+
+
+def same_segments(a, b):
+    """Segment sets equal up to endpoint order"""
+    key = lambda segments: np.sort(np.round(np.sort(segments.reshape(-1, 4), axis=1), 9), axis=0)
+    return a.shape == b.shape and np.allclose(key(a), key(b))
+
+
+def main():
+    random.seed(0)
+    displays = [random_display() for _ in range(200)]
+
+    for display in displays:
+        legacy = np.array([s for shape in display for s in legacy_shape_stripes(*shape)])
+        assert same_segments(legacy, display_stripes(display)[0])
+    print("batched stripes match the per-stripe code on 200 displays")
+
+    n = 20
+    legacy = timeit.timeit(lambda: [legacy_shape_stripes(*shape) for d in displays for shape in d], number=n)
+    per_shape = timeit.timeit(lambda: [shape_stripes(*shape) for d in displays for shape in d], number=n)
+    per_display = timeit.timeit(lambda: [display_stripes(d) for d in displays], number=n)
+    scale = 1e6 / (n * len(displays))
+    print(f"per display: per-stripe loops {legacy * scale:.0f} us, batched per shape {per_shape * scale:.0f} us, "
+          f"batched per display {per_display * scale:.0f} us")
+
+
+if __name__ == '__main__':
+    main()
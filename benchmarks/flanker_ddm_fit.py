@@ -0,0 +1,60 @@
+"""Drift-diffusion fitting throughput on simulated flanker datasets
+
+Run from the repository root: python benchmarks/flanker_ddm_fit.py [n_datasets] [workers]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flanker_ddm import ez_starts, fit_dataset, fit_datasets, log_likelihood, param_names, simulate_dataset
+
+
+def main(n_datasets=40, workers=None):
+    rng = np.random.default_rng(1)
+    true_params = np.column_stack([rng.uniform(0.5, 3.0, n_datasets), rng.uniform(0.8, 2.0, n_datasets),
+                                   rng.uniform(0.2, 0.4, n_datasets)])
+    datasets = []
+    for i, params in enumerate(true_params):
+        rt, correct = simulate_dataset(params, n_trials=200, seed=i)
+        datasets.append({'rt': rt, 'correct': correct})
+
+    rt, correct = datasets[0]['rt'], datasets[0]['correct']
+    sets = np.tile(true_params[0], (50, 1))
+    start = time.perf_counter()
+    for _ in range(20):
+        log_likelihood(sets, rt, correct)
+    batch_time = (time.perf_counter() - start) / 20
+    start = time.perf_counter()
+    for params in sets[:10]:
+        for t in range(len(rt)):
+            log_likelihood(params, rt[t:t + 1], correct[t:t + 1])
+    scalar_time = (time.perf_counter() - start) / 10
+    print(f"likelihood, 50 parameter sets x {len(rt)} trials: {batch_time * 1e3:.2f} ms batched, "
+          f"{scalar_time * 50 * 1e3:.0f} ms one set and one trial at a time")
+
+    start = time.perf_counter()
+    starts = ez_starts(datasets)
+    print(f"EZ estimates for {n_datasets} datasets in {(time.perf_counter() - start) * 1e3:.2f} ms")
+
+    start = time.perf_counter()
+    fit_dataset(rt, correct, starts[0])
+    print(f"one dataset fitted in {time.perf_counter() - start:.3f} s")
+
+    start = time.perf_counter()
+    fits = fit_datasets(datasets, workers)
+    pool_time = time.perf_counter() - start
+    print(f"{n_datasets} datasets fitted in {pool_time:.2f} s ({n_datasets / pool_time:.1f} datasets/s)")
+
+    fitted = np.array([[fit[name] for name in param_names] for fit in fits])
+    for i, name in enumerate(param_names):
+        r = np.corrcoef(true_params[:, i], fitted[:, i])[0, 1]
+        r_ez = np.corrcoef(true_params[:, i], starts[:, i])[0, 1]
+        print(f"recovery of {name}: r = {r:.2f} (EZ {r_ez:.2f})")
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,52 @@
+"""Fitting throughput of the WCST sequential learning model on simulated sessions
+
+Run from the repository root: python benchmarks/wcst_model_fit.py [n_sessions] [workers]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from wcst_model import fit_session, fit_sessions, log_likelihood, param_names, simulate_session
+
+
+def main(n_sessions=16, workers=None):
+    rng = np.random.default_rng(1)
+    true_params = np.column_stack([rng.uniform(0.1, 0.6, n_sessions), rng.uniform(0.05, 0.4, n_sessions),
+                                   rng.uniform(1.0, 3.0, n_sessions), rng.uniform(0.5, 2.0, n_sessions)])
+    sessions = [simulate_session(params, seed=i) for i, params in enumerate(true_params)]
+
+    matches, choices, correct = sessions[0]
+    starts = np.tile(true_params[0], (200, 1))
+    start = time.perf_counter()
+    for _ in range(20):
+        log_likelihood(starts, matches, choices, correct)
+    batch_time = (time.perf_counter() - start) / 20
+    start = time.perf_counter()
+    for params in starts[:20]:
+        log_likelihood(params, matches, choices, correct)
+    single_time = (time.perf_counter() - start) / 20
+    print(f"likelihood, 200 parameter sets: {batch_time * 1e3:.2f} ms batched, "
+          f"{single_time * 200 * 1e3:.2f} ms one at a time")
+
+    start = time.perf_counter()
+    fit_session(*sessions[0])
+    serial_time = time.perf_counter() - start
+    print(f"one session fitted in {serial_time:.2f} s")
+
+    start = time.perf_counter()
+    fits = fit_sessions(sessions, workers)
+    pool_time = time.perf_counter() - start
+    print(f"{n_sessions} sessions fitted in {pool_time:.2f} s ({n_sessions / pool_time:.1f} sessions/s)")
+
+    fitted = np.array([[fit[name] for name in param_names] for fit in fits])
+    for i, name in enumerate(param_names):
+        r = np.corrcoef(true_params[:, i], fitted[:, i])[0, 1]
+        print(f"recovery of {name}: r = {r:.2f}")
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
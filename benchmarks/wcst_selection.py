@@ -0,0 +1,122 @@
+"""Per-trial cost of picking WCST reference cards: dict scan against the reference set table
+
+Run from the repository root: python benchmarks/wcst_selection.py
+"""
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from wcst_cards import load_reference_sets, response_keys, standard_deck
+
+all_images = list(range(1, 65))
+
+
+# the dict based implementation that wisconsinsorting.py used before the card table, in full
+def legacy_card_properties(image_num):
+    number = (image_num - 1) % 4 + 1
+    group = (image_num - 1) // 16
+    color_group = ((image_num - 1) % 16) // 4
+    shapes = ['triangle', 'circle', 'star', 'cross']
+    colors = ['green', 'red', 'blue', 'yellow']
+    return {'number': number, 'shape': shapes[group], 'color': colors[color_group], 'image_num': image_num}
+
+
+def legacy_select_reference_cards(bottom_card):
+    color_matches = []
+    shape_matches = []
+    number_matches = []
+
+    for num in all_images:
+        if num == bottom_card['image_num']:
+            continue
+        props = legacy_card_properties(num)
+        if props['color'] == bottom_card['color']:
+            color_matches.append(num)
+        if props['shape'] == bottom_card['shape']:
+            shape_matches.append(num)
+        if props['number'] == bottom_card['number']:
+            number_matches.append(num)
+
+    selected = []
+    if color_matches:
+        selected.append(random.choice(color_matches))
+    if shape_matches:
+        selected.append(random.choice(shape_matches))
+    if number_matches:
+        selected.append(random.choice(number_matches))
+
+    while len(selected) < 4:
+        remaining = [num for num in all_images if num != bottom_card['image_num'] and num not in selected]
+        if not remaining:
+            break
+        selected.append(random.choice(remaining))
+
+    matches = 0
+    for num in selected:
+        props = legacy_card_properties(num)
+        if (props['color'] == bottom_card['color'] or
+                props['shape'] == bottom_card['shape'] or
+                props['number'] == bottom_card['number']):
+            matches += 1
+
+    if matches < 2:
+        for i in range(len(selected)):
+            props = legacy_card_properties(selected[i])
+            if not (props['color'] == bottom_card['color'] or
+                    props['shape'] == bottom_card['shape'] or
+                    props['number'] == bottom_card['number']):
+                for rule in ['color', 'shape', 'number']:
+                    if rule == 'color' and color_matches:
+                        selected[i] = random.choice(color_matches)
+                        break
+                    elif rule == 'shape' and shape_matches:
+                        selected[i] = random.choice(shape_matches)
+                        break
+                    elif rule == 'number' and number_matches:
+                        selected[i] = random.choice(number_matches)
+                        break
+
+    return selected[:4]
+
+
+def legacy_correct_answer(rule, bottom_card, top_cards):
+    for i, card in enumerate(top_cards):
+        if bottom_card[rule] == card[rule]:
+            return ['card1', 'card2', 'card3', 'card4'][i]
+    return 'card4'
+
+
+def legacy_trial():
+    bottom_card = legacy_card_properties(random.choice(all_images))
+    refs = legacy_select_reference_cards(bottom_card)
+    top_cards = [legacy_card_properties(num) for num in refs]
+    legacy_correct_answer('shape', bottom_card, top_cards)
+
+
+deck = standard_deck()
+
+
+reference_sets = load_reference_sets(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                 'Wisconsin_Material', 'reference_sets.bin'), deck)
+
+
+def reference_table_trial():
+    bottom_card = deck[random.choice(deck.image_nums)]
+    refs = reference_sets.draw(bottom_card.image_num)
+    top_cards = [deck[num] for num in refs]
+    value = bottom_card['shape']
+    for key, card in zip(response_keys, top_cards):
+        if card['shape'] == value:
+            break
+
+
+if __name__ == '__main__':
+    n = 20000
+    random.seed(1)
+    for name, func in (('dict + scan', legacy_trial), ('set table', reference_table_trial)):
+        best = min(timeit.repeat(func, number=n, repeat=5)) / n
+        print(f"{name:12s} {best * 1e6:8.2f} us per trial")
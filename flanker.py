@@ -1,6 +1,11 @@
 # -*- coding: utf-8 -*-
-import os, random
+import os
+from functools import partial
 from psychopy import core, visual, event, data, gui, logging
+from psychopy.hardware import keyboard
+from flanker_sequence import session_blocks, session_seed
+from flanker_stimuli import FlankerDisplayCache, FlankerStimulusPool
+from glyph_atlas import GlyphAtlas
 
 
 practice_trials = 16
@@ -9,11 +14,23 @@ n_blocks = 5
 rt_limit = 1.5 
 cue_duration = 2.0  
 iti_duration = 0.2 
+# practice accuracy needed to go on to the main trials
+practice_threshold = 0.75
+# longest run of one task within a block
+max_task_run = 4
+# show each trial as one prerendered texture instead of drawing its stimuli
+use_display_cache = True
+# log how long each keypress took to reach the script after its backend
+# timestamp, and add it to the data as key_latency
+validate_timing = False
 
 expInfo = {'Participant ID': '', 'Session': '001'}
 dlg = gui.DlgFromDict(expInfo, title='')
 if not dlg.OK:
     core.quit()
+# every block's trial sequence is fixed by the participant and session
+expInfo['seed'] = session_seed(expInfo['Participant ID'], expInfo['Session'])
+blocks = session_blocks(expInfo['seed'], n_blocks, practice_trials, main_trials, max_task_run)
 
 dataDir = 'data'
 if not os.path.exists(dataDir):
@@ -28,7 +45,16 @@ thisExp = data.ExperimentHandler(name=expName,
 
 
 win = visual.Window(fullscr=True, color='white', units='norm')
-logging.console.setLevel(logging.WARNING)
+logging.console.setLevel(logging.INFO if validate_timing else logging.WARNING)
+
+frame_rate = win.getActualFrameRate()
+frame_period = 1.0 / frame_rate if frame_rate else 1.0 / 60
+
+# the arrow font is looked up and every glyph rendered here, not on the first trial
+glyphs = GlyphAtlas(win, font='Arial Unicode MS')
+
+kb = keyboard.Keyboard()
+key_latencies = []
 
 def check_exit(keys):
     if 'escape' in keys:
@@ -51,8 +77,7 @@ def show_text(key, **fmt):
     win.color = 'white'
     win.flip()
     txt = instr[key].format(**fmt)
-    stim = visual.TextStim(win, text=txt,
-        height=0.08, wrapWidth=1.4, color='black')
+    stim = glyphs.text(txt, 0.08, size=(1.4, 1.8), color='black')
     stim.draw(); win.flip()
     while True:
         keys = event.waitKeys(keyList=['space','escape'])
@@ -62,102 +87,133 @@ def show_text(key, **fmt):
 
 positions = [(-0.4,0.4),(0,0.4),(0.4,0.4),(-0.4,0),(0,0),(0.4,0),(-0.4,-0.4),(0,-0.4),(0.4,-0.4)]
 
-def make_arrow(direction, pos):
-    sym = '←' if direction=='left' else '→'
-    return visual.TextStim(win, text=sym,
-        pos=pos, height=0.15, color='black', font='Arial Unicode MS')
-
-def make_shape(is_triangle, pos):
-    if is_triangle:
-        return visual.ShapeStim(win,
-            vertices=[(-.1,-.1),(0,.12),(.1,-.1)],
-            pos=pos, fillColor='black', lineColor='black')
-    else:
-        return visual.Circle(win,
-            radius=0.1, pos=pos,
-            fillColor='black', lineColor='black')
-
-
-def run_trials(nTrials):
+stim_pool = FlankerStimulusPool(win, positions, glyphs)
+display_cache = FlankerDisplayCache(win, stim_pool) if use_display_cache else None
+glyphs.report()
+
+def draw_display(key):
+    """Draw one trial display; returns the number of draw calls it took"""
+    if display_cache:
+        display_cache.draw(key)
+        return 1
+    draws = stim_pool.n_draws
+    stim_pool.draw()
+    return stim_pool.n_draws - draws
+
+
+def key_latency(key):
+    """Time from a key's backend timestamp until now; None if the backend has no timestamps"""
+    if kb.getBackend() == 'event':
+        return None
+    # key.rt is the backend timestamp on kb.clock, so both times share one base
+    return kb.clock.getTime() - key.rt
+
+def collect_response():
+    """First a/l press within rt_limit of the last kb.clock reset, as (key, rt, latency)"""
+    while kb.clock.getTime() < rt_limit:
+        keys = kb.getKeys(['a','l','escape'], waitRelease=False)
+        if keys:
+            key = keys[0]
+            return key.name, key.rt, key_latency(key)
+        # leave the CPU to the keyboard backend between polls
+        core.wait(0.001, hogCPUperiod=0)
+    return '', rt_limit, None
+
+def report_key_latencies():
+    lat = sorted(key_latencies)
+    if not lat:
+        return
+    n = len(lat)
+    logging.info(f"{kb.getBackend()} keyboard latency over {n} keys: median {lat[n // 2] * 1000:.2f} ms, "
+                 f"95th percentile {lat[int(n * 0.95)] * 1000:.2f} ms, max {lat[-1] * 1000:.2f} ms")
+
+
+def plan_trial(t, spec, block, phase):
+    """Display and data row of one trial from its sequence entry, set up before its cue"""
+    row = {'block': block, 'phase': phase, 'trial': t, 'attend': spec['attend'], 'switch': spec['switch']}
+    if spec['attend'] == 'shape':
+        color = spec['bg_color']
+        center_tri = spec['center_tri']
+        row.update(center_is_triangle=center_tri, bg_color=color)
+        return {'row': row, 'bg': color, 'display': ('shape', center_tri, color),
+                'correct_key': 'a' if center_tri else 'l'}
+    focus_word = spec['focus_word']
+    center_dir = spec['center_dir']
+    row.update(center_arrow=center_dir, focus_word=focus_word)
+    return {'row': row, 'bg': 'white', 'display': ('arrow', center_dir, focus_word),
+            'correct_key': 'a' if center_dir == 'left' else 'l'}
+
+def save_row(row):
+    for key, value in row.items():
+        thisExp.addData(key, value)
+    thisExp.nextEntry()
+
+def hold_screen(duration, *tasks):
+    """Keep the current screen up for duration, flipping every frame.
+
+    One task runs after each flip while the screen is up, so the work for
+    whatever comes next is done before the period ends. Returns the time of
+    the last flip and the tasks' results.
+    """
+    n_frames = max(1, round(duration / frame_period))
+    results = []
+    for frame in range(n_frames):
+        last_flip = win.flip()
+        if last_flip is None:
+            last_flip = logging.defaultClock.getTime()
+        if frame < len(tasks):
+            results.append(tasks[frame]())
+    results.extend(task() for task in tasks[n_frames:])
+    return last_flip, results
+
+
+def run_trials(trial_list, block, phase):
     n_correct = 0
-    half = nTrials // 2
-    trial_list = ['shape']*half + ['arrow']*half
-    random.shuffle(trial_list)
-
-    for t, attend in enumerate(trial_list, start=1):
-        if attend == 'shape':
-            color = random.choice(['red','blue'])
-            win.color = color
-            win.flip()
-            core.wait(cue_duration)
-        else:
-            win.color = 'white'
-            win.flip()
-            focus_word = random.choice(['inside','outside'])
-            core.wait(cue_duration)
-
-        stimuli = []
-        if attend == 'shape':
-            center_tri = random.choice([True, False])
-            flank = [not center_tri]*8
-            correctKey = 'a' if center_tri else 'l'
-            config = flank[:4] + [center_tri] + flank[4:]
-            for pos, tri in zip(positions, config):
-                stimuli.append(make_shape(tri, pos))
-        else:
-            center_dir = random.choice(['left','right'])
-            flank_dir = 'right' if center_dir == 'left' else 'left'
-            correctKey = 'a' if center_dir=='left' else 'l'
-            for i, pos in enumerate(positions):
-                if i == 4: 
-                    stimuli.append(make_arrow(center_dir, pos))
-                else: 
-                    stimuli.append(make_arrow(flank_dir, pos))
-
-        win.color = color if attend == 'shape' else 'white'
-        for stim in stimuli:
-            stim.draw()
-        
-        if attend == 'arrow':
-            visual.TextStim(win, text=focus_word,
-                pos=(0,-0.6), height=0.1, color='black').draw()
+    nTrials = len(trial_list)
+
+    trial = plan_trial(1, trial_list[0], block, phase)
+    for t in range(1, nTrials + 1):
+        # the cue is the plain background; the target display is set up
+        # during it, so onset only has to draw and flip
+        win.color = trial['bg']
+        cue_tasks = () if display_cache else (partial(stim_pool.set_display, trial['display']),)
+        last_flip, _ = hold_screen(cue_duration, *cue_tasks)
+
+        prep_start = logging.defaultClock.getTime()
+        draw_calls = draw_display(trial['display'])
+        ready = logging.defaultClock.getTime()
         
+        # RTs come from the keyboard backend's timestamps, relative to the
+        # flip that shows the stimuli
+        win.callOnFlip(kb.clock.reset)
+        win.callOnFlip(kb.clearEvents, eventType='keyboard')
         win.flip()
-        trial_onset = core.getTime()
 
-        keys = event.waitKeys(
-            maxWait=rt_limit,
-            keyList=['a','l','escape'],
-            timeStamped=core.Clock()
-        )
-        
-        if keys:
-            response, rt = keys[0]
-            check_exit([response])
-            rt = rt - trial_onset  
-        else:
-            response = ''
-            rt = rt_limit
+        response, rt, latency = collect_response()
+        check_exit([response])
+        if latency is not None and validate_timing:
+            key_latencies.append(latency)
 
-        win.color = 'white'
-        win.flip()
-        core.wait(iti_duration)
-
-        correct = int(response == correctKey)
+        correct = int(response == trial['correct_key'])
         n_correct += correct
-        thisExp.addData('trial', t)
-        thisExp.addData('attend', attend)
-        if attend == 'shape':
-            thisExp.addData('center_is_triangle', center_tri)
-            thisExp.addData('bg_color', color)
-        else:
-            thisExp.addData('center_arrow', center_dir)
-            thisExp.addData('focus_word', focus_word)
-        thisExp.addData('respKey', response)
-        thisExp.addData('accuracy', correct)
-        thisExp.addData('rt', rt)
-        thisExp.nextEntry()
-
+        # slack is what was left of the frame before the onset flip
+        row = dict(trial['row'], respKey=response, accuracy=correct, rt=rt,
+                   prep_time=ready - prep_start, slack=frame_period - (ready - last_flip),
+                   draw_calls=draw_calls)
+        if validate_timing:
+            row['key_latency'] = latency
+
+        # the row is saved and the next trial planned during the ITI
+        win.color = 'white'
+        iti_tasks = [partial(save_row, row)]
+        if t < nTrials:
+            iti_tasks.append(partial(plan_trial, t + 1, trial_list[t], block, phase))
+        _, results = hold_screen(iti_duration, *iti_tasks)
+        if t < nTrials:
+            trial = results[1]
+
+    if validate_timing:
+        report_key_latencies()
     return n_correct / nTrials
 
 show_text('welcome')
@@ -165,25 +221,26 @@ show_text('features')
 show_text('bg_map')
 show_text('before_blocks')
 
-for block in range(1, n_blocks+1):
+for block, (practice_lists, main_list) in enumerate(blocks, start=1):
     show_text('start_block', blockNum=block)
     show_text('practice')
+    attempt = 0
     while True:
-        acc = run_trials(practice_trials)
+        acc = run_trials(practice_lists[attempt % len(practice_lists)], block, 'practice')
+        attempt += 1
         win.color = 'white'
         win.flip()
         fb_txt = (f"Practice Accuracy: {acc*100:.0f}%\n\nPress Space Bar to continue"  
                   if acc>=practice_threshold
                   else f"Practice Accuracy: {acc*100:.0f}%\n\nPress Space Bar to retry practice")
-        fb = visual.TextStim(win, text=fb_txt,
-            height=0.07, wrapWidth=1.4, color='black')
+        fb = glyphs.text(fb_txt, 0.07, size=(1.4, 1.8), color='black')
         fb.draw(); win.flip()
         keys = event.waitKeys(keyList=['space','escape'])
         check_exit(keys)
         if acc>=practice_threshold: break
 
     show_text('begin_trials')
-    run_trials(main_trials)
+    run_trials(main_list, block, 'main')
 
 show_text('thanks')
 thisExp.saveAsWideText(filename + '.csv')
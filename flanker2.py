@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 import os, random
 from psychopy import core, visual, event, data, gui, logging
-import numpy as np
+from stripes import display_stripes, triangle_vertices
+from shape_glyphs import ShapeGlyphCache
+from vertexbatch import LineBatch
 
 practice_trials = 16  
 main_trials = 50
@@ -9,6 +11,12 @@ n_blocks = 4
 rt_limit = 1.5
 iti_duration = 0.2
 required_accuracy = 0.75  
+# draw each shape with its stripes from a texture rendered once; rendered
+# textures are kept in glyph_dir for later sessions (None keeps none)
+use_glyph_cache = True
+glyph_dir = 'glyph_cache'
+# show info messages, such as the glyph cache counts, on the console
+verbose_log = False
 
 expInfo = {'Participant ID': '', 'Session': '001'}
 dlg = gui.DlgFromDict(expInfo, title='Flanker Task')
@@ -25,6 +33,10 @@ thisExp = data.ExperimentHandler(name='FlankerTask',
                               dataFileName=filename)
 
 win = visual.Window(fullscr=True, color='white', units='norm')
+logging.console.setLevel(logging.INFO if verbose_log else logging.WARNING)
+glyphs = ShapeGlyphCache(win, glyph_dir) if use_glyph_cache else None
+if glyphs:
+    glyphs.prepare((0.1, 0.15))
 
 def check_exit(keys):
     if 'escape' in keys:
@@ -32,92 +44,33 @@ def check_exit(keys):
         win.close()
         core.quit()
 
-def make_shape_with_stripes(is_triangle, line_direction, pos, size=0.1):
+stripe_width = 3
+stripe_color = (0, 0, 0, 1)
+
+def make_shape(is_triangle, pos, size=0.1):
     if is_triangle:
-        vertices = np.array([[-size, -size], [0, size*1.5], [size, -size]])
-        shape = visual.ShapeStim(win,
-            vertices=vertices,
+        return visual.ShapeStim(win,
+            vertices=triangle_vertices(size),
             pos=pos, fillColor='white', lineColor='black')
-    else:
-        shape = visual.Circle(win,
-            radius=size, pos=pos,
-            fillColor='white', lineColor='black')
-
-
-    stripes = []
-    spacing = 0.025 
-
-    angle = np.pi / 4 if line_direction == 'left' else -np.pi / 4
-    direction = np.array([np.cos(angle), np.sin(angle)])
-    perp = np.array([-direction[1], direction[0]]) 
-
-    for i in range(8):
-        offset = (i - 4 + 0.5) * spacing
-        origin = np.array(pos) + offset * perp
-
-        line_start = origin - 2 * direction
-        line_end = origin + 2 * direction
-
-        if is_triangle:
-            abs_vertices = vertices + np.array(pos)
-
-            intersections = []
-            for j in range(3):
-                p1 = abs_vertices[j]
-                p2 = abs_vertices[(j + 1) % 3]
-                inter = segment_intersection(line_start, line_end, p1, p2)
-                if inter is not None:
-                    intersections.append(inter)
-
-            if len(intersections) == 2:
-                xys = np.array(intersections)
-                line = visual.Line(win, start=xys[0], end=xys[1],
-                                   lineColor='black', lineWidth=3)
-                stripes.append(line)
-        else:
-            intersections = circle_line_intersections(np.array(pos), size, line_start, line_end)
-            if len(intersections) == 2:
-                xys = np.array(intersections)
-                line = visual.Line(win, start=xys[0], end=xys[1],
-                                   lineColor='black', lineWidth=3)
-                stripes.append(line)
-
-    return shape, stripes
-
-def segment_intersection(p1, p2, q1, q2):
-    """Find intersection point between segments p1–p2 and q1–q2"""
-    A = np.array([[p2[0] - p1[0], q1[0] - q2[0]],
-                  [p2[1] - p1[1], q1[1] - q2[1]]])
-    b = np.array([q1[0] - p1[0], q1[1] - p1[1]])
-    try:
-        t, u = np.linalg.solve(A, b)
-        if 0 <= t <= 1 and 0 <= u <= 1:
-            return p1 + t * (p2 - p1)
-    except np.linalg.LinAlgError:
-        pass
-    return None
-
-def circle_line_intersections(center, radius, p1, p2):
-    """Return two points where line intersects the circle"""
-    d = p2 - p1
-    f = p1 - center
-    a = np.dot(d, d)
-    b = 2 * np.dot(f, d)
-    c = np.dot(f, f) - radius ** 2
-
-    discriminant = b ** 2 - 4 * a * c
-    if discriminant < 0:
-        return []
-
-    sqrt_disc = np.sqrt(discriminant)
-    t1 = (-b + sqrt_disc) / (2 * a)
-    t2 = (-b - sqrt_disc) / (2 * a)
-
-    intersections = []
-    for t in [t1, t2]:
-        if 0 <= t <= 1 or True: 
-            intersections.append(p1 + t * d)
-    return intersections
+    return visual.Circle(win,
+        radius=size, pos=pos,
+        fillColor='white', lineColor='black')
+
+def make_display(items, size=0.1):
+    """Shapes of (is_triangle, line_direction, pos) items, and all their stripes as one LineBatch"""
+    shapes = [make_shape(is_triangle, pos, size) for is_triangle, _, pos in items]
+    endpoints, _ = display_stripes(items, size)
+    return shapes, LineBatch(win, endpoints, stripe_width, stripe_color)
+
+def draw_display(items, size=0.1):
+    """Draw (is_triangle, line_direction, pos) items"""
+    if glyphs:
+        glyphs.draw_display(items, size)
+        return
+    shapes, stripes = make_display(items, size)
+    for shape in shapes:
+        shape.draw()
+    stripes.draw()
 
 def run_trial(trial_type, is_practice=False):
     win.color = 'white'
@@ -139,13 +92,9 @@ def run_trial(trial_type, is_practice=False):
     fixation = visual.TextStim(win, text='+', height=0.2, color='black')
     
     positions = [(-0.5,0), (-0.25,0), (0,0), (0.25,0), (0.5,0)]
-    stimuli = []
-    for i, pos in enumerate(positions):
-        if i == 2: 
-            shape, stripes = make_shape_with_stripes(center_shape == 'triangle', center_line, pos)
-        else: 
-            shape, stripes = make_shape_with_stripes(flank_shape == 'triangle', flank_line, pos)
-        stimuli.append((shape, stripes))
+    items = [(center_shape == 'triangle', center_line, pos) if i == 2
+             else (flank_shape == 'triangle', flank_line, pos)
+             for i, pos in enumerate(positions)]
     
 
     instruction = visual.TextStim(win,
@@ -157,25 +106,21 @@ def run_trial(trial_type, is_practice=False):
         pos=(0, -0.8), height=0.06, color='black')
     
     fixation.draw()
-    for shape, stripes in stimuli:
-        shape.draw()
-        for stripe in stripes:
-            stripe.draw()
+    draw_display(items)
     instruction.draw()
     reminder.draw()
     
     win.flip()
-    trial_onset = core.getTime()
+    rt_clock = core.Clock()
     
     keys = event.waitKeys(maxWait=rt_limit,
                         keyList=['a','l','escape'],
-                        timeStamped=core.Clock())
+                        timeStamped=rt_clock)
     
     if keys:
         response, rt = keys[0]
         if response == 'escape':
             check_exit([response])
-        rt = rt - trial_onset
     else:
         response = ''
         rt = rt_limit
@@ -216,11 +161,10 @@ def show_instructions():
     
     win.color = 'white'
     
-    shape1, stripes1 = make_shape_with_stripes(True, 'left', (-0.3, 0.3), size=0.15)
+    examples = [(True, 'left', (-0.3, 0.3)), (False, 'right', (0.3, 0.3))]
     text1 = visual.TextStim(win, text="SHAPE example:", pos=(-0.3, 0.6), height=0.06, color='black')
     answer1 = visual.TextStim(win, text="Press 'A' for triangle", pos=(-0.3, -0.4), height=0.06, color='black')
     
-    shape2, stripes2 = make_shape_with_stripes(False, 'right', (0.3, 0.3), size=0.15)
     text2 = visual.TextStim(win, text="SHAPE example:", pos=(0.3, 0.6), height=0.06, color='black')
     answer2 = visual.TextStim(win, text="Press 'L' for circle", pos=(0.3, -0.4), height=0.06, color='black')
     
@@ -229,16 +173,10 @@ def show_instructions():
         pos=(0, -0.7), height=0.06, color='black')
         
     text1.draw()
-    shape1.draw()
-    for stripe in stripes1:
-        stripe.draw()
     answer1.draw()
-    
     text2.draw()
-    shape2.draw()
-    for stripe in stripes2:
-        stripe.draw()
     answer2.draw()
+    draw_display(examples, size=0.15)
     
     instruction.draw()
     win.flip()
@@ -246,11 +184,9 @@ def show_instructions():
     
     win.color = 'white'
     
-    shape3, stripes3 = make_shape_with_stripes(True, 'left', (-0.3, 0.3), size=0.15)
     text3 = visual.TextStim(win, text="LINE example:", pos=(-0.3, 0.6), height=0.06, color='black')
     answer3 = visual.TextStim(win, text="Press 'A' for left", pos=(-0.3, -0.4), height=0.06, color='black')
     
-    shape4, stripes4 = make_shape_with_stripes(False, 'right', (0.3, 0.3), size=0.15)
     text4 = visual.TextStim(win, text="LINE example:", pos=(0.3, 0.6), height=0.06, color='black')
     answer4 = visual.TextStim(win, text="Press 'L' for right", pos=(0.3, -0.4), height=0.06, color='black')
     
@@ -259,16 +195,10 @@ def show_instructions():
         pos=(0, -0.7), height=0.06, color='black')
     
     text3.draw()
-    shape3.draw()
-    for stripe in stripes3:
-        stripe.draw()
     answer3.draw()
-    
     text4.draw()
-    shape4.draw()
-    for stripe in stripes4:
-        stripe.draw()
     answer4.draw()
+    draw_display(examples, size=0.15)
     
     instruction.draw()
     win.flip()
@@ -341,5 +271,7 @@ win.flip()
 event.waitKeys(keyList=['space','escape'])
 
 thisExp.saveAsWideText(filename + '.csv')
+if glyphs:
+    glyphs.report()
 win.close()
 core.quit()
\ No newline at end of file
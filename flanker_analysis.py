@@ -0,0 +1,234 @@
+"""Switch, cue-type and block effects for the sessions written by flanker.py.
+
+    python flanker_analysis.py data [--out flanker_summary.csv] [--practice]
+
+Session files are parsed once into a columnar cache, data/.flanker_sessions.npz,
+that holds every trial of the cohort as one array per column. A file is parsed
+again only when its modification time or size changes, and all summaries are
+computed over the whole cohort at once by grouping on integer keys.
+
+RTs are means over correct responses. The first trial of every practice or
+main run is neither a switch nor a repeat. Sessions recorded before the block,
+phase and switch columns were added are split into runs where the trial number
+restarts; runs longer than a practice run are taken to be main runs.
+"""
+import argparse
+import csv
+import glob
+import os
+import time
+
+import numpy as np
+
+from flanker_sequence import cues, tasks
+
+cache_name = '.flanker_sessions.npz'
+cue_names = tuple(value for _, value in cues)
+practice_trials = 16
+trial_columns = ('trial', 'block', 'main', 'task', 'cue', 'switch', 'correct', 'responded', 'rt')
+trial_dtypes = {'trial': np.int16, 'block': np.int16, 'main': bool, 'task': np.int8, 'cue': np.int8,
+                'switch': np.int8, 'correct': bool, 'responded': bool, 'rt': np.float32}
+file_columns = ('name', 'mtime_ns', 'size', 'participant', 'session')
+
+
+def read_session(path):
+    """Per-trial column arrays of one session file, or None if it has no trials"""
+    with open(path, newline='') as f:
+        rows = [row for row in csv.DictReader(f) if row.get('attend')]
+    if not rows:
+        return None
+    trial = np.array([int(row['trial']) for row in rows])
+    task = np.array([tasks.index(row['attend']) for row in rows])
+    cue = np.array([cue_names.index(row['bg_color'] if row['attend'] == 'shape' else row['focus_word'])
+                    for row in rows])
+
+    run = np.cumsum(trial == 1) - 1
+    first = np.concatenate([[True], run[1:] != run[:-1]])
+    if rows[0].get('phase'):
+        main = np.array([row['phase'] == 'main' for row in rows])
+        block = np.array([int(row['block']) for row in rows])
+    else:
+        run_main = np.bincount(run) > practice_trials
+        main = run_main[run]
+        # practice runs belong to the block of the main run that follows them
+        block = (np.cumsum(run_main) - run_main + 1)[run]
+
+    switch = np.concatenate([[0], task[1:] != task[:-1]]).astype(np.int8)
+    switch[first] = -1
+    session = {
+        'trial': trial.astype(np.int16),
+        'block': block.astype(np.int16),
+        'main': main,
+        'task': task.astype(np.int8),
+        'cue': cue.astype(np.int8),
+        'switch': switch,
+        'correct': np.array([row['accuracy'] == '1' for row in rows]),
+        'responded': np.array([row['respKey'] != '' for row in rows]),
+        'rt': np.array([float(row['rt']) for row in rows], dtype=np.float32),
+        'participant': rows[0].get('Participant ID') or os.path.basename(path).split('_')[0],
+        'session': rows[0].get('Session', ''),
+    }
+    return session
+
+
+def load_cohort(data_dir, pattern='*_FlankerSwitchTask_*.csv'):
+    """Every trial of every matching session, parsing only files not in the cache.
+
+    Returns a dict of trial column arrays with a 'file' index into the file
+    columns, which are returned under 'files'.
+    """
+    cache_path = os.path.join(data_dir, cache_name)
+    try:
+        with np.load(cache_path) as cached:
+            cache = {name: cached[name] for name in cached.files}
+    except (OSError, ValueError, KeyError):
+        cache = None
+
+    cached_files = {}
+    if cache is not None:
+        ends = np.cumsum(cache['n_trials'])
+        for i, name in enumerate(cache['name']):
+            cached_files[str(name)] = (i, ends[i] - cache['n_trials'][i], ends[i])
+
+    files = {name: [] for name in file_columns}
+    pieces = {name: [] for name in trial_columns}
+    n_trials = []
+    n_parsed = 0
+    for path in sorted(glob.glob(os.path.join(data_dir, pattern))):
+        name = os.path.basename(path)
+        stat = os.stat(path)
+        entry = cached_files.get(name)
+        if entry and cache['mtime_ns'][entry[0]] == stat.st_mtime_ns and cache['size'][entry[0]] == stat.st_size:
+            i, start, end = entry
+            session = {column: cache[column][start:end] for column in trial_columns}
+            session.update(participant=str(cache['participant'][i]), session=str(cache['session'][i]))
+        else:
+            session = read_session(path)
+            n_parsed += 1
+            if session is None:
+                # kept with no trials, so the file is not parsed again until it changes
+                session = {column: np.zeros(0, dtype=trial_dtypes[column]) for column in trial_columns}
+                session.update(participant='', session='')
+        files['name'].append(name)
+        files['mtime_ns'].append(stat.st_mtime_ns)
+        files['size'].append(stat.st_size)
+        files['participant'].append(session['participant'])
+        files['session'].append(session['session'])
+        n_trials.append(len(session['trial']))
+        for column in trial_columns:
+            pieces[column].append(session[column])
+
+    dtypes = {'mtime_ns': np.int64, 'size': np.int64, 'name': str, 'participant': str, 'session': str}
+    files = {name: np.array(values, dtype=dtypes[name]) for name, values in files.items()}
+    files['n_trials'] = np.array(n_trials, dtype=np.int64)
+    cohort = {column: np.concatenate(values) if values else np.zeros(0, dtype=trial_dtypes[column])
+              for column, values in pieces.items()}
+    if n_parsed or cache is None or list(files['name']) != list(cached_files):
+        tmp_path = cache_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **files, **cohort)
+        os.replace(tmp_path, cache_path)
+
+    cohort['file'] = np.repeat(np.arange(len(n_trials)), n_trials)
+    cohort['files'] = files
+    cohort['n_parsed'] = n_parsed
+    return cohort
+
+
+def grouped_means(group, n_groups, values, mask):
+    """Mean of values over the masked trials of each group; nan for empty groups"""
+    counts = np.bincount(group[mask], minlength=n_groups)
+    sums = np.bincount(group[mask], weights=values[mask], minlength=n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / counts
+
+
+def condition_means(cohort, condition, n_conditions, keep):
+    """(sessions, conditions) mean correct RT and accuracy"""
+    n_files = len(cohort['files']['name'])
+    group = cohort['file'] * n_conditions + condition
+    n_groups = n_files * n_conditions
+    rt = grouped_means(group, n_groups, cohort['rt'], keep & cohort['correct'])
+    accuracy = grouped_means(group, n_groups, cohort['correct'], keep)
+    return rt.reshape(n_files, n_conditions), accuracy.reshape(n_files, n_conditions)
+
+
+def block_slopes(means):
+    """Least-squares change per block of each row of (sessions, blocks) means, ignoring nans"""
+    blocks = np.arange(1, means.shape[1] + 1)
+    valid = ~np.isnan(means)
+    n = valid.sum(axis=1)
+    x = np.where(valid, blocks, 0)
+    y = np.where(valid, means, 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x_mean = x.sum(axis=1) / n
+        y_mean = y.sum(axis=1) / n
+        dx = np.where(valid, blocks - x_mean[:, None], 0)
+        return (dx * (y - y_mean[:, None])).sum(axis=1) / (dx ** 2).sum(axis=1)
+
+
+def summarise(cohort, include_practice=False):
+    """One row of switch, cue-type and block effects per session"""
+    keep = np.ones(len(cohort['trial']), dtype=bool) if include_practice else cohort['main'].astype(bool)
+    files = cohort['files']
+    n_files = len(files['name'])
+
+    overall_rt, overall_accuracy = condition_means(cohort, np.zeros_like(cohort['file']), 1, keep)
+    # switch + 1: 0 first trial of a run, 1 repeat, 2 switch
+    switch_rt, switch_accuracy = condition_means(cohort, cohort['switch'] + 1, 3, keep)
+    cue_rt, cue_accuracy = condition_means(cohort, cohort['cue'], len(cue_names), keep)
+    task_rt, task_accuracy = condition_means(cohort, cohort['task'], len(tasks), keep)
+    n_blocks = int(cohort['block'].max()) if len(cohort['block']) else 0
+    block_rt, block_accuracy = condition_means(cohort, cohort['block'] - 1, n_blocks, keep)
+    rt_slope = block_slopes(block_rt)
+    accuracy_slope = block_slopes(block_accuracy)
+    n_trials = np.bincount(cohort['file'][keep], minlength=n_files)
+
+    summary = []
+    for i in range(n_files):
+        if not files['n_trials'][i]:
+            continue
+        row = {
+            'file': files['name'][i], 'participant': files['participant'][i], 'session': files['session'][i],
+            'trials': int(n_trials[i]), 'rt': overall_rt[i, 0], 'accuracy': overall_accuracy[i, 0],
+            'rt_repeat': switch_rt[i, 1], 'rt_switch': switch_rt[i, 2],
+            'switch_cost_rt': switch_rt[i, 2] - switch_rt[i, 1],
+            'accuracy_repeat': switch_accuracy[i, 1], 'accuracy_switch': switch_accuracy[i, 2],
+            'switch_cost_accuracy': switch_accuracy[i, 1] - switch_accuracy[i, 2],
+        }
+        for c, cue in enumerate(cue_names):
+            row[f'rt_{cue}'] = cue_rt[i, c]
+            row[f'accuracy_{cue}'] = cue_accuracy[i, c]
+        # word cues (arrow task) against background cues (shape task)
+        row['cue_cost_rt'] = task_rt[i, 1] - task_rt[i, 0]
+        row['cue_cost_accuracy'] = task_accuracy[i, 0] - task_accuracy[i, 1]
+        for b in range(n_blocks):
+            row[f'rt_block{b + 1}'] = block_rt[i, b]
+            row[f'accuracy_block{b + 1}'] = block_accuracy[i, b]
+        row['block_slope_rt'] = rt_slope[i]
+        row['block_slope_accuracy'] = accuracy_slope[i]
+        summary.append(row)
+    return summary
+
+
+def write_summary(summary, path):
+    fieldnames = list(summary[0]) if summary else ['file', 'participant', 'session']
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(summary)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Summarise flanker switch task sessions")
+    parser.add_argument('data_dir', nargs='?', default='data')
+    parser.add_argument('--pattern', default='*_FlankerSwitchTask_*.csv')
+    parser.add_argument('--out', default='flanker_summary.csv')
+    parser.add_argument('--practice', action='store_true', help="include practice trials")
+    args = parser.parse_args()
+    start = time.perf_counter()
+    cohort = load_cohort(args.data_dir, args.pattern)
+    summary = summarise(cohort, args.practice)
+    elapsed = time.perf_counter() - start
+    write_summary(summary, args.out)
+    print(f"{len(summary)} sessions ({cohort['n_parsed']} parsed) summarised into {args.out} in {elapsed:.2f} s")
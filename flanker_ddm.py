@@ -0,0 +1,239 @@
+"""Drift-diffusion fits for the sessions written by flanker.py and flanker2.py.
+
+    python flanker_ddm.py data [--out flanker_ddm_fits.csv] [--workers 4]
+
+Responses are coded for accuracy: correct responses end at the upper
+boundary and errors at the lower one, the starting point is midway and the
+diffusion coefficient is 1. Each condition of each session (attend in
+flanker.py, trial_type in flanker2.py; main trials only) gets its own drift
+v, boundary separation a and non-decision time t0.
+
+The first-passage time density follows Navarro & Fuss (2009), taking the
+small- or large-time series per trial with as many terms as its error bound
+needs. It is evaluated for a whole batch of parameter sets over all trials
+at once, mixed with a small uniform contaminant so that responses faster
+than t0 are not impossible. EZ-diffusion estimates (Wagenmakers et al.,
+2007) are computed for every dataset at once and seed the fits, which start
+from the best of a batch of points around them and refine with L-BFGS-B.
+Trials without a response, and flanker2.py RTs that are not positive, are
+left out.
+"""
+import argparse
+import csv
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from batchfit import fit_starts
+from flanker_analysis import read_session as read_switch_session
+from flanker_sequence import tasks
+
+param_names = ('v', 'a', 't0')
+bounds = np.array([[-5.0, 10.0], [0.3, 5.0], [0.05, 1.0]])
+rt_limit = 1.5
+# uniform contaminant over the response window, shared by both boundaries
+lapse = 0.02
+series_eps = 1e-10
+
+
+def series_terms(u):
+    """Terms the small- and large-time series need at normalised time u"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        large = 1 / (np.pi * np.sqrt(u))
+        bound = np.pi * u * series_eps
+        large = np.where(bound < 1, np.maximum(large, np.sqrt(-2 * np.log(bound) / (np.pi ** 2 * u))), large)
+        bound = 2 * np.sqrt(2 * np.pi * u) * series_eps
+        small = np.where(bound < 1, np.maximum(np.sqrt(u) + 1, 2 + np.sqrt(-2 * u * np.log(bound))), 2)
+    return np.ceil(small), np.ceil(large)
+
+
+def unit_density(u, w):
+    """First-passage density at the lower boundary for zero drift and unit separation"""
+    density = np.zeros_like(u)
+    n_small, n_large = series_terms(u)
+    use_small = n_small < n_large
+
+    us, ws = u[use_small], w[use_small]
+    if us.size:
+        n = int(n_small[use_small].max())
+        k = np.arange(-((n - 1) // 2), (n - 1) // 2 + (n - 1) % 2 + 1)
+        x = ws[:, None] + 2 * k
+        density[use_small] = (x * np.exp(-x ** 2 / (2 * us[:, None]))).sum(axis=1) / np.sqrt(2 * np.pi * us ** 3)
+
+    ul, wl = u[~use_small], w[~use_small]
+    if ul.size:
+        k = np.arange(1, int(n_large[~use_small].max()) + 1)
+        terms = k * np.exp(-k ** 2 * np.pi ** 2 * ul[:, None] / 2) * np.sin(k * np.pi * wl[:, None])
+        density[~use_small] = np.pi * terms.sum(axis=1)
+    return np.maximum(density, 0)
+
+
+def wiener_density(rt, correct, v, a, t0, w=0.5):
+    """Density of each response, for parameter arrays broadcasting against the trials"""
+    t = rt - t0
+    decided = t > 0
+    # the upper boundary is the lower one with the drift and start mirrored
+    v = np.where(correct, -v, v)
+    w = np.where(correct, 1 - w, w)
+    v, a, w, t = np.broadcast_arrays(v, a, w, np.where(decided, t, 1.0))
+    u = t / a ** 2
+    density = np.exp(-v * a * w - v ** 2 * t / 2) / a ** 2 * unit_density(u.ravel(), w.ravel()).reshape(u.shape)
+    return np.where(decided, density, 0)
+
+
+def log_likelihood(params, rt, correct):
+    """Log-likelihood of one dataset for each parameter set in a batch"""
+    params = np.atleast_2d(params)
+    v, a, t0 = params[:, 0:1], params[:, 1:2], params[:, 2:3]
+    density = wiener_density(rt, correct, v, a, t0)
+    return np.log((1 - lapse) * density + lapse / (2 * rt_limit)).sum(axis=1)
+
+
+def ez_diffusion(accuracy, rt_var, rt_mean, n_trials):
+    """EZ-diffusion (v, a, t0) arrays from per-dataset accuracy and correct RT moments.
+
+    Accuracies of 0, 0.5 and 1 are moved by half a trial, where the
+    equations have no solution.
+    """
+    edge = 1 / (2 * n_trials)
+    accuracy = np.clip(accuracy, edge, 1 - edge)
+    accuracy = np.where(accuracy == 0.5, 0.5 + edge, accuracy)
+    logit = np.log(accuracy / (1 - accuracy))
+    x = logit * (logit * accuracy ** 2 - logit * accuracy + accuracy - 0.5) / rt_var
+    v = np.sign(accuracy - 0.5) * np.abs(x) ** 0.25
+    a = logit / v
+    y = -v * a
+    decision_mean = (a / (2 * v)) * (1 - np.exp(y)) / (1 + np.exp(y))
+    return v, a, rt_mean - decision_mean
+
+
+def ez_starts(datasets):
+    """EZ estimates for every dataset at once, clipped to the fitting bounds"""
+    group = np.repeat(np.arange(len(datasets)), [len(d['rt']) for d in datasets])
+    rt = np.concatenate([d['rt'] for d in datasets])
+    correct = np.concatenate([d['correct'] for d in datasets])
+    n_groups = len(datasets)
+    n_trials = np.bincount(group, minlength=n_groups)
+    n_correct = np.bincount(group, weights=correct, minlength=n_groups)
+    rt_sum = np.bincount(group, weights=rt * correct, minlength=n_groups)
+    rt_sq = np.bincount(group, weights=rt ** 2 * correct, minlength=n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rt_mean = rt_sum / n_correct
+        rt_var = np.maximum(rt_sq / n_correct - rt_mean ** 2, 1e-4)
+        v, a, t0 = ez_diffusion(n_correct / n_trials, rt_var, rt_mean, n_trials)
+    starts = np.column_stack([v, a, t0])
+    starts = np.where(np.isfinite(starts), starts, bounds.mean(axis=1))
+    # t0 must leave room for the fastest responses
+    fastest = np.array([d['rt'].min() for d in datasets])
+    starts[:, 2] = np.minimum(starts[:, 2], fastest - 0.01)
+    return np.clip(starts, bounds[:, 0], bounds[:, 1])
+
+
+def fit_dataset(rt, correct, start=None, n_starts=50, n_refine=2, seed=0):
+    rng = np.random.default_rng(seed)
+    starts = bounds[:, 0] + rng.random((n_starts, 3)) * (bounds[:, 1] - bounds[:, 0])
+    if start is not None:
+        spread = 0.1 * (bounds[:, 1] - bounds[:, 0])
+        starts[:n_starts // 2] = np.clip(start + rng.normal(0, 1, (n_starts // 2, 3)) * spread,
+                                         bounds[:, 0], bounds[:, 1])
+        starts[0] = start
+    best = fit_starts(lambda params: log_likelihood(params, rt, correct), starts, bounds, n_refine)
+    fit = dict(zip(param_names, best.x))
+    fit.update(log_likelihood=-best.fun, n_trials=len(rt))
+    return fit
+
+
+def simulate_dataset(params, n_trials=100, dt=1e-3, seed=None):
+    """RTs and accuracies of n_trials simulated responses, all trials stepped together"""
+    rng = np.random.default_rng(seed)
+    v, a, t0 = params
+    x = np.full(n_trials, a / 2)
+    rt = np.full(n_trials, np.inf)
+    correct = np.zeros(n_trials, dtype=bool)
+    active = np.arange(n_trials)
+    t = 0.0
+    while active.size and t0 + t < rt_limit:
+        t += dt
+        x[active] += v * dt + np.sqrt(dt) * rng.standard_normal(active.size)
+        done = (x[active] >= a) | (x[active] <= 0)
+        rt[active[done]] = t0 + t
+        correct[active[done]] = x[active[done]] >= a
+        active = active[~done]
+    responded = np.isfinite(rt)
+    return rt[responded], correct[responded]
+
+
+def read_datasets(path):
+    """Main-trial (rt, correct) data of each condition in a flanker.py or flanker2.py session"""
+    name = os.path.basename(path)
+    with open(path, newline='') as f:
+        header = next(csv.reader(f), [])
+    if 'attend' in header:
+        session = read_switch_session(path)
+        if session is None:
+            return []
+        keep = session['main'] & session['responded']
+        condition, rt, correct = session['task'], session['rt'].astype(float), session['correct']
+        labels, participant = tasks, session['participant']
+    elif 'trial_type' in header:
+        with open(path, newline='') as f:
+            rows = [row for row in csv.DictReader(f) if row.get('trial_type')]
+        if not rows:
+            return []
+        labels = ('shape', 'line')
+        condition = np.array([labels.index(row['trial_type']) for row in rows])
+        rt = np.array([float(row['rt']) for row in rows])
+        correct = np.array([row['correct'] == '1' for row in rows])
+        keep = np.array([row['is_practice'] == '0' and row['response'] != '' for row in rows])
+        participant = rows[0].get('Participant ID') or name.split('_')[0]
+    else:
+        return []
+    keep &= (rt > 0) & (rt < rt_limit)
+    return [{'file': name, 'participant': participant, 'condition': label,
+             'rt': rt[keep & (condition == c)], 'correct': correct[keep & (condition == c)]}
+            for c, label in enumerate(labels) if np.any(keep & (condition == c))]
+
+
+def fit_datasets(datasets, workers=None):
+    """Fit datasets in parallel from their EZ estimates, in order"""
+    starts = ez_starts(datasets)
+    jobs = [(d['rt'], d['correct'], start) for d, start in zip(datasets, starts)]
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        chunksize = max(1, len(jobs) // (4 * workers))
+        fits = list(pool.map(_fit_args, jobs, chunksize=chunksize))
+    for fit, start in zip(fits, starts):
+        fit.update({f'ez_{name}': value for name, value in zip(param_names, start)})
+    return fits
+
+
+def _fit_args(job):
+    return fit_dataset(*job)
+
+
+def fit_directory(data_dir, pattern='*_Flanker*.csv', workers=None):
+    datasets = [d for path in sorted(glob.glob(os.path.join(data_dir, pattern))) for d in read_datasets(path)]
+    if not datasets:
+        return []
+    fits = fit_datasets(datasets, workers)
+    for fit, d in zip(fits, datasets):
+        fit.update(file=d['file'], participant=d['participant'], condition=d['condition'])
+    return fits
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fit drift-diffusion models to flanker sessions")
+    parser.add_argument('data_dir', nargs='?', default='data')
+    parser.add_argument('--pattern', default='*_Flanker*.csv')
+    parser.add_argument('--out', default='flanker_ddm_fits.csv')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+    fits = fit_directory(args.data_dir, args.pattern, args.workers)
+    with open(args.out, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=('file', 'participant', 'condition') + param_names
+                                + ('log_likelihood', 'n_trials') + tuple(f'ez_{name}' for name in param_names))
+        writer.writeheader()
+        writer.writerows(fits)
+    print(f"{len(fits)} conditions fitted into {args.out}")
@@ -0,0 +1,199 @@
+"""Seeded trial sequences for the flanker switch task in flanker.py.
+
+    python flanker_sequence.py [--sessions 5000] [--trials 50] [--max-run 4] [--seed 0]
+
+Each block has as many shape as arrow trials, as many task switches as
+repeats (to within one), no more than max_run trials of one task in a row,
+the two cues of each task (red/blue background, inside/outside word) equally
+often, and both correct keys equally often under every cue. Task orders are
+built for many sequences at once by cutting each task's trials into capped
+runs and interleaving them; cues and targets are then assigned by ranking
+random keys, which balances them exactly. Nothing is redrawn, so a whole
+cohort takes a fraction of a second.
+"""
+import argparse
+import time
+import zlib
+
+import numpy as np
+
+tasks = ('shape', 'arrow')
+# cue types: task index and cue value (background color or focus word)
+cues = ((0, 'red'), (0, 'blue'), (1, 'inside'), (1, 'outside'))
+
+
+def session_seed(participant, session):
+    return zlib.crc32(f'{participant}/{session}'.encode('utf-8'))
+
+
+def run_lengths_ok(task, max_run):
+    """Rows of a (sequences, trials) task array with no run longer than max_run"""
+    n_trials = task.shape[1]
+    if max_run >= n_trials:
+        return np.ones(len(task), dtype=bool)
+    # a run of max_run + 1 means max_run transitions in a row without a switch
+    repeat = task[:, 1:] == task[:, :-1]
+    window = np.cumsum(np.pad(repeat, ((0, 0), (1, 0))), axis=1)
+    repeats_in_window = window[:, max_run:] - window[:, :-max_run]
+    return ~np.any(repeats_in_window == max_run, axis=1)
+
+
+def rank_within(groups, rng):
+    """Random rank of each trial among the trials of its group, per row"""
+    n_groups = groups.max() + 1
+    order = np.argsort(groups + rng.random(groups.shape), axis=1)
+    rank = np.empty_like(order)
+    np.put_along_axis(rank, order, np.arange(groups.shape[1]), axis=1)
+    counts = np.stack([(groups == g).sum(axis=1) for g in range(n_groups)], axis=1)
+    starts = np.cumsum(counts, axis=1) - counts
+    return rank - np.take_along_axis(starts, groups, axis=1)
+
+
+def balanced_labels(groups, rng):
+    """0/1 label per trial, balanced within every group of every row.
+
+    Which label gets the extra trial of an odd-sized group is random.
+    """
+    offset = rng.integers(2, size=(len(groups), groups.max() + 1))
+    return (rank_within(groups, rng) + np.take_along_axis(offset, groups, axis=1)) % 2
+
+
+def composition_counts(size, n_parts, max_run):
+    """counts[k, m]: ways to write m as an ordered sum of k parts of 1..max_run"""
+    counts = np.zeros((n_parts + 1, size + 1))
+    counts[0, 0] = 1
+    for k in range(1, n_parts + 1):
+        for length in range(1, max_run + 1):
+            counts[k, length:] += counts[k - 1, :size + 1 - length]
+    return counts
+
+
+def random_runs(n_rows, size, n_runs, max_run, rng):
+    """Run index of each of size items cut into n_runs runs of at most max_run.
+
+    Run lengths are drawn one at a time, each weighted by the number of
+    compositions it leaves for the remaining runs, so every allowed
+    composition is equally likely.
+    """
+    counts = composition_counts(size, n_runs, max_run)
+    lengths = np.arange(1, max_run + 1)
+    remaining = np.full(n_rows, size)
+    ends = np.empty((n_rows, n_runs), dtype=np.int64)
+    for part in range(n_runs):
+        rest = remaining[:, None] - lengths
+        weights = np.where(rest >= 0, counts[n_runs - part - 1, np.maximum(rest, 0)], 0)
+        cumulative = np.cumsum(weights, axis=1)
+        pick = (cumulative > rng.random((n_rows, 1)) * cumulative[:, -1:]).argmax(axis=1)
+        remaining = remaining - lengths[pick]
+        ends[:, part] = size - remaining
+    return (np.arange(size) >= ends[:, :, None]).sum(axis=1)
+
+
+def task_orders(n_sequences, n_trials, max_run, rng):
+    """Task index per trial for n_sequences balanced, run-capped orders.
+
+    A number of switches is drawn for each sequence, which fixes how many
+    runs each task has; each task's trials are cut into that many runs and
+    the runs interleaved.
+    """
+    layouts = []
+    for n_first in sorted({n_trials // 2, (n_trials + 1) // 2}):
+        for n_runs in range((n_trials - 1) // 2 + 1, n_trials // 2 + 2):
+            sizes = ((n_first, (n_runs + 1) // 2), (n_trials - n_first, n_runs // 2))
+            if all(parts <= size <= parts * max_run for size, parts in sizes):
+                layouts.append(sizes)
+    if not layouts:
+        raise ValueError(f"no balanced order of {n_trials} trials has runs of at most {max_run}")
+
+    task = np.empty((n_sequences, n_trials), dtype=np.int64)
+    layout = rng.integers(len(layouts), size=n_sequences)
+    first_task = rng.integers(2, size=(n_sequences, 1))
+    for i, ((n_first, first_parts), (n_second, second_parts)) in enumerate(layouts):
+        rows = np.flatnonzero(layout == i)
+        run = np.concatenate([2 * random_runs(len(rows), n_first, first_parts, max_run, rng),
+                              2 * random_runs(len(rows), n_second, second_parts, max_run, rng) + 1], axis=1)
+        order = np.argsort(run * n_trials + np.arange(n_trials), axis=1)
+        is_first = order < n_first
+        task[rows] = np.where(is_first, first_task[rows], 1 - first_task[rows])
+    return task
+
+
+def generate_sequences(n_sequences, n_trials, max_run=4, rng=None):
+    """Trial arrays of shape (sequences, trials).
+
+    task is an index into tasks, cue an index into cues and target 1 where
+    the correct key is 'a' (center triangle, or center arrow pointing left).
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    task = task_orders(n_sequences, n_trials, max_run, rng)
+    cue = 2 * task + balanced_labels(task, rng)
+    target = balanced_labels(cue, rng)
+    switch = np.zeros(task.shape, dtype=bool)
+    switch[:, 1:] = task[:, 1:] != task[:, :-1]
+    return {'task': task, 'cue': cue, 'target': target, 'switch': switch}
+
+
+def check_sequences(sequences, max_run=4):
+    """Raise ValueError if any sequence breaks the block constraints"""
+    task, cue, target = sequences['task'], sequences['cue'], sequences['target']
+    n_trials = task.shape[1]
+    if np.any(np.abs(2 * task.sum(axis=1) - n_trials) > n_trials % 2):
+        raise ValueError("unbalanced tasks")
+    switches = np.count_nonzero(task[:, 1:] != task[:, :-1], axis=1)
+    if np.any(np.abs(2 * switches - (n_trials - 1)) > 1):
+        raise ValueError("unbalanced switches and repeats")
+    if not run_lengths_ok(task, max_run).all():
+        raise ValueError(f"a task runs for more than {max_run} trials")
+    if np.any(cue // 2 != task):
+        raise ValueError("a cue does not belong to its trial's task")
+    for t in range(len(tasks)):
+        pair = np.stack([(cue == 2 * t).sum(axis=1), (cue == 2 * t + 1).sum(axis=1)])
+        if np.any(np.abs(pair[0] - pair[1]) > 1):
+            raise ValueError(f"unbalanced cues for the {tasks[t]} task")
+    for c in range(len(cues)):
+        under_cue = cue == c
+        if np.any(np.abs(2 * (target & under_cue).sum(axis=1) - under_cue.sum(axis=1)) > 1):
+            raise ValueError(f"unbalanced correct keys under cue {cues[c][1]}")
+
+
+def sequence_trials(sequences, i):
+    """Trial specifications of sequence i, as flanker.py uses them"""
+    trials = []
+    for task, cue, target, switch in zip(sequences['task'][i], sequences['cue'][i],
+                                         sequences['target'][i], sequences['switch'][i]):
+        value = cues[cue][1]
+        if task == 0:
+            trial = {'attend': 'shape', 'bg_color': value, 'center_tri': bool(target)}
+        else:
+            trial = {'attend': 'arrow', 'focus_word': value, 'center_dir': 'left' if target else 'right'}
+        trial['switch'] = bool(switch)
+        trials.append(trial)
+    return trials
+
+
+def session_blocks(seed, n_blocks, practice_trials, main_trials, max_run=4, practice_sets=3):
+    """Practice and main trials for every block of one session.
+
+    Each block gets practice_sets different practice sequences, for
+    participants who have to repeat the practice, and one main sequence.
+    """
+    rng = np.random.default_rng(seed)
+    practice = generate_sequences(n_blocks * practice_sets, practice_trials, max_run, rng)
+    main = generate_sequences(n_blocks, main_trials, max_run, rng)
+    return [([sequence_trials(practice, b * practice_sets + i) for i in range(practice_sets)],
+             sequence_trials(main, b))
+            for b in range(n_blocks)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate and check a cohort of flanker sequences")
+    parser.add_argument('--sessions', type=int, default=5000)
+    parser.add_argument('--trials', type=int, default=50)
+    parser.add_argument('--max-run', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    sequences = generate_sequences(args.sessions, args.trials, args.max_run, np.random.default_rng(args.seed))
+    elapsed = time.perf_counter() - start
+    check_sequences(sequences, args.max_run)
+    print(f"{args.sessions} sequences of {args.trials} trials in {elapsed:.2f} s, all constraints met")
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+from psychopy import visual
+
+arrow_symbols = {'left': '←', 'right': '→'}
+# the arrow glyph is drawn pointing right and turned round for left
+arrow_oris = {'left': 180, 'right': 0}
+focus_words = ('inside', 'outside')
+opposite = {'left': 'right', 'right': 'left'}
+
+
+class FlankerStimulusPool:
+    """Every stimulus flanker.py can show, built once per session.
+
+    All nine arrows are one ElementArrayStim masked with the atlas's arrow
+    glyph, and each slot has its own triangle and circle; setting up a
+    display only turns arrows and picks shapes, so no glyph is rendered and
+    no shape tessellated during the trials.
+    """
+
+    def __init__(self, win, positions, atlas, center=4):
+        self.win = win
+        self.center = center
+        self.arrows = atlas.symbol_array(arrow_symbols['right'], positions, 0.15, colors='black')
+        self.shapes = [{True: visual.ShapeStim(win, vertices=[(-.1, -.1), (0, .12), (.1, -.1)], pos=pos,
+                                               fillColor='black', lineColor='black'),
+                        False: visual.Circle(win, radius=0.1, pos=pos, fillColor='black', lineColor='black')}
+                       for pos in positions]
+        self.focus_words = {word: atlas.text(word, 0.1, pos=(0, -0.6), size=(1, 0.2), color='black')
+                            for word in focus_words}
+        self.slots = []
+        self.n_draws = 0
+
+    def set_arrows(self, center_dir, flank_dir, focus_word=None):
+        self.arrows.oris = [arrow_oris[center_dir if i == self.center else flank_dir]
+                            for i in range(self.arrows.nElements)]
+        self.slots = [self.arrows]
+        if focus_word:
+            self.slots.append(self.focus_words[focus_word])
+
+    def set_shapes(self, center_tri, flank_tri):
+        self.slots = [shapes[center_tri if i == self.center else flank_tri]
+                      for i, shapes in enumerate(self.shapes)]
+
+    def set_display(self, key):
+        """Set up a display by its FlankerDisplayCache key"""
+        if key[0] == 'shape':
+            self.set_shapes(key[1], not key[1])
+        else:
+            self.set_arrows(key[1], opposite[key[1]], key[2])
+
+    def draw(self):
+        for stim in self.slots:
+            stim.draw()
+        self.n_draws += len(self.slots)
+
+
+class FlankerDisplayCache:
+    """Every distinct flanker display captured once into a window-sized texture.
+
+    Arrow displays are keyed ('arrow', center_dir, focus_word) and shape
+    displays ('shape', center_tri, bg_color); flankers always oppose the
+    center, so there are eight. Each capture includes its background, so
+    a trial is one texture draw. Capturing clears the back buffer, so the
+    cache is built before anything is drawn for the next frame.
+    """
+
+    def __init__(self, win, pool, bg_colors=('red', 'blue')):
+        self.win = win
+        self.displays = {}
+        self.n_draws = 0
+        for center_dir in arrow_symbols:
+            for word in focus_words:
+                self._capture(('arrow', center_dir, word), pool, 'white')
+        for center_tri in (True, False):
+            for color in bg_colors:
+                self._capture(('shape', center_tri, color), pool, color)
+        win.color = 'white'
+
+    def _capture(self, key, pool, color):
+        pool.set_display(key)
+        self.win.color = color
+        self.displays[key] = visual.BufferImageStim(self.win, stim=[pool])
+
+    def draw(self, key):
+        self.displays[key].draw()
+        self.n_draws += 1
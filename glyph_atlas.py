@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import string
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from psychopy import logging, visual
+from psychopy.tools.fontmanager import GLFont
+from psychopy.tools.monitorunittools import convertToPix
+from psychopy.visual.textbox2 import allFonts
+
+text_chars = string.ascii_letters + string.digits + string.punctuation + ' '
+
+
+def resolve_font(name):
+    """Path of the font file PsychoPy would use for a font name"""
+    return str(allFonts.getFontsMatching(name, fallback=True)[0].path)
+
+
+class GlyphAtlas:
+    """One font resolved once per session, with every glyph a task needs rendered up front.
+
+    Symbol glyphs are rasterized with PIL into square masks, so a row of
+    arrows is one ElementArrayStim that only changes its orientations.
+    Text is laid out by TextBox2 from GLFonts built here from the resolved
+    file and preloaded with text_chars, so all text of one height shares a
+    single atlas texture and no glyph is rendered once the trials start.
+    Time spent on each part is kept in timings.
+    """
+
+    def __init__(self, win, font='Arial Unicode MS', symbols='→', cell=128, text_chars=text_chars):
+        self.win = win
+        self.cell = cell
+        self.text_chars = text_chars
+        self.timings = {}
+        self.text_fonts = {}
+
+        start = time.perf_counter()
+        self.font_path = resolve_font(font)
+        self.timings['resolve'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        # glyphs are drawn at three quarters of the cell to leave room for
+        # their side bearings
+        self.glyph_size = cell * 3 // 4
+        face = ImageFont.truetype(self.font_path, self.glyph_size)
+        self.masks = {symbol: self._rasterize(face, symbol) for symbol in symbols}
+        self.timings['rasterize'] = time.perf_counter() - start
+
+    def _rasterize(self, face, symbol):
+        image = Image.new('L', (self.cell, self.cell), 0)
+        ImageDraw.Draw(image).text((self.cell / 2, self.cell / 2), symbol, fill=255, font=face, anchor='mm')
+        # masks run from -1 (transparent) to 1, with the first row at the bottom
+        return np.flipud(np.asarray(image, dtype=float) / 127.5 - 1)
+
+    def text_font(self, height):
+        """GLFont for letters of height in window units, preloaded with text_chars"""
+        size = int(round(convertToPix(np.zeros(2), np.array([0, height]), self.win.units, self.win)[1]))
+        font = self.text_fonts.get(size)
+        if font is None:
+            start = time.perf_counter()
+            font = self.text_fonts[size] = GLFont(self.font_path, size)
+            font.fetch(self.text_chars)
+            self.timings['text'] = self.timings.get('text', 0) + time.perf_counter() - start
+        return font
+
+    def text(self, text, height, **params):
+        """Centred TextBox2 drawing from the shared atlas of its height"""
+        params.setdefault('alignment', 'center')
+        return visual.TextBox2(self.win, text, font=self.text_font(height), letterHeight=height, **params)
+
+    def symbol_array(self, symbol, positions, height, **params):
+        """ElementArrayStim showing symbol at each position, height as for a TextStim"""
+        # square cells whatever the window's aspect ratio
+        width = height * self.win.size[1] / self.win.size[0] if self.win.units == 'norm' else height
+        scale = self.cell / self.glyph_size
+        return visual.ElementArrayStim(self.win, units=self.win.units, nElements=len(positions), xys=positions,
+                                       sizes=(width * scale, height * scale), elementTex=None,
+                                       elementMask=self.masks[symbol], **params)
+
+    def report(self):
+        total = sum(self.timings.values())
+        parts = ', '.join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in self.timings.items())
+        logging.info(f"font work for {self.font_path}: {total * 1000:.1f} ms ({parts})")
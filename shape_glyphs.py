@@ -0,0 +1,133 @@
+import hashlib
+import math
+import os
+
+import numpy as np
+from PIL import Image, ImageDraw
+from psychopy import logging, visual
+from psychopy.tools.monitorunittools import convertToPix
+
+import stripes
+from stripes import shape_stripes, triangle_vertices
+
+# line widths in pixels, as the ShapeStim/Circle outlines and the stripes have
+outline_width = 1.5
+stripe_width = 3
+# glyphs are drawn this many times larger and scaled down, for antialiasing
+supersample = 4
+margin = 2
+fill_color = 'white'
+line_color = 'black'
+
+
+def render_hash():
+    """Short hash of everything render_glyph depends on besides its arguments"""
+    params = (outline_width, stripe_width, supersample, margin, fill_color, line_color,
+              stripes.n_stripes, stripes.stripe_spacing, sorted(stripes.stripe_angles.items()), stripes.reach)
+    return hashlib.sha1(repr(params).encode('utf-8')).hexdigest()[:10]
+
+
+def glyph_bounds(is_triangle, size):
+    """(left, bottom, right, top) of a glyph around its shape's position"""
+    if is_triangle:
+        return -size, -size, size, 1.5 * size
+    return -size, -size, size, size
+
+
+def render_glyph(is_triangle, line_direction, size, scale):
+    """RGBA image of a shape and its stripes; scale is pixels per unit along x and y"""
+    left, bottom, right, top = glyph_bounds(is_triangle, size)
+    sx, sy = scale[0] * supersample, scale[1] * supersample
+    pad = margin * supersample
+    width = int(math.ceil((right - left) * scale[0])) + 2 * margin
+    height = int(math.ceil((top - bottom) * scale[1])) + 2 * margin
+
+    def to_image(points):
+        return [((x - left) * sx + pad, (top - y) * sy + pad) for x, y in points]
+
+    image = Image.new('RGBA', (width * supersample, height * supersample), (255, 255, 255, 0))
+    draw = ImageDraw.Draw(image)
+    outline = max(1, round(outline_width * supersample))
+    if is_triangle:
+        draw.polygon(to_image(triangle_vertices(size)), fill=fill_color, outline=line_color, width=outline)
+    else:
+        draw.ellipse(to_image([(-size, size), (size, -size)]), fill=fill_color, outline=line_color, width=outline)
+    for start, end in shape_stripes(is_triangle, line_direction, (0, 0), size):
+        draw.line(to_image([start, end]), fill=line_color, width=round(stripe_width * supersample))
+    return image.resize((width, height), Image.LANCZOS)
+
+
+class ShapeGlyphCache:
+    """flanker2.py shapes with their stripes, each rendered once to a texture.
+
+    Glyphs are keyed by (is_triangle, line_direction, size) and drawn as one
+    ImageStim each. With a directory, rendered glyphs are saved there as PNG
+    files named for their key, the window size and a hash of the rendering
+    parameters, and later sessions load them instead of rendering, until
+    the drawing changes. n_hits counts glyphs found in memory and
+    n_misses the rest, of which n_loaded came from the directory.
+    """
+
+    def __init__(self, win, directory=None):
+        self.win = win
+        self.directory = directory
+        self.scale = np.abs(convertToPix(np.array([1.0, 1.0]), (0, 0), win.units, win))
+        self.render_hash = render_hash()
+        self.glyphs = {}
+        self.n_hits = 0
+        self.n_misses = 0
+        self.n_loaded = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        is_triangle, line_direction, size = key
+        width, height = self.win.size
+        name = (f"{'triangle' if is_triangle else 'circle'}_{line_direction}_{size:g}_{width}x{height}"
+                f"_{self.render_hash}.png")
+        return os.path.join(self.directory, name)
+
+    def get(self, is_triangle, line_direction, size):
+        """ImageStim of a glyph and the offset of its center from the shape's position"""
+        key = (bool(is_triangle), line_direction, float(size))
+        glyph = self.glyphs.get(key)
+        if glyph is not None:
+            self.n_hits += 1
+            return glyph
+        self.n_misses += 1
+
+        path = self._path(key) if self.directory else None
+        if path and os.path.exists(path):
+            with Image.open(path) as saved:
+                image = saved.convert('RGBA')
+            self.n_loaded += 1
+        else:
+            image = render_glyph(*key, self.scale)
+            if path:
+                image.save(path)
+        left, bottom, right, top = glyph_bounds(key[0], key[2])
+        stim = visual.ImageStim(self.win, image=image, units=self.win.units,
+                                size=(image.size[0] / self.scale[0], image.size[1] / self.scale[1]))
+        glyph = self.glyphs[key] = (stim, np.array([(left + right) / 2, (bottom + top) / 2]))
+        return glyph
+
+    def prepare(self, sizes):
+        """Load or render every glyph of the given sizes"""
+        for size in sizes:
+            for is_triangle in (True, False):
+                for line_direction in ('left', 'right'):
+                    self.get(is_triangle, line_direction, size)
+
+    def draw(self, is_triangle, line_direction, pos, size):
+        stim, offset = self.get(is_triangle, line_direction, size)
+        stim.pos = offset + pos
+        stim.draw()
+
+    def draw_display(self, items, size):
+        """Draw (is_triangle, line_direction, pos) items"""
+        for is_triangle, line_direction, pos in items:
+            self.draw(is_triangle, line_direction, pos, size)
+
+    def report(self):
+        logging.info(f"shape glyphs: {self.n_hits} hits, {self.n_misses} misses "
+                     f"({self.n_loaded} loaded from disk, {self.n_misses - self.n_loaded} rendered)")
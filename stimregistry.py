@@ -0,0 +1,39 @@
+class StimulusRegistry:
+    """Builds each named stimulus once and hands out the same instance after.
+
+    Stimuli are declared with define and built by build_all, or on first
+    use. Constructions are counted per phase so a task can check that
+    nothing is built once its trials have started.
+    """
+
+    def __init__(self, win):
+        self.win = win
+        self.definitions = {}
+        self.stims = {}
+        self.phase = 'setup'
+        self.n_built = {}
+
+    def define(self, name, stim_class, **params):
+        self.definitions[name] = (stim_class, params)
+
+    def build_all(self):
+        for name in self.definitions:
+            self.get(name)
+
+    def start_phase(self, phase):
+        self.phase = phase
+
+    def built_in(self, phase):
+        return self.n_built.get(phase, 0)
+
+    def get(self, name):
+        stim = self.stims.get(name)
+        if stim is None:
+            stim_class, params = self.definitions[name]
+            stim = self.stims[name] = stim_class(self.win, **params)
+            self.n_built[self.phase] = self.n_built.get(self.phase, 0) + 1
+        return stim
+
+    def draw(self, *names):
+        for name in names:
+            self.get(name).draw()
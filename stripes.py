@@ -0,0 +1,111 @@
+"""Clipping of families of parallel stripes against the flanker2.py shapes.
+
+Every stripe is a line o + t * d for t in [-reach, reach]. Convex polygons
+are clipped with Cyrus-Beck, every line against every edge at once; circles
+solve the line-circle quadratic for every line at once. Clipping returns an
+(n, 2, 2) array of endpoints with a mask of the lines that cross the shape.
+"""
+import numpy as np
+
+n_stripes = 8
+stripe_spacing = 0.025
+stripe_angles = {'left': np.pi / 4, 'right': -np.pi / 4}
+reach = 2.0
+
+
+def triangle_vertices(size):
+    return np.array([[-size, -size], [0, size * 1.5], [size, -size]])
+
+
+def stripe_family(pos, line_direction, n=n_stripes, spacing=stripe_spacing):
+    """Origins (n, 2) and unit direction of a shape's stripes, centred on pos"""
+    angle = stripe_angles[line_direction]
+    direction = np.array([np.cos(angle), np.sin(angle)])
+    perp = np.array([-direction[1], direction[0]])
+    offsets = (np.arange(n) - n / 2 + 0.5) * spacing
+    return np.asarray(pos, dtype=float) + offsets[:, None] * perp, direction
+
+
+def clip_polygon(origins, direction, vertices, reach=reach):
+    """Endpoints and mask of lines clipped against a convex polygon.
+
+    vertices is (k, 2), or (n, k, 2) for a polygon per line; either winding.
+    """
+    origins = np.asarray(origins, dtype=float)
+    vertices = np.asarray(vertices, dtype=float)
+    edges = np.roll(vertices, -1, axis=-2) - vertices
+    # outward normals whatever the winding
+    area = np.sum(vertices[..., 0] * np.roll(vertices[..., 1], -1, axis=-1)
+                  - np.roll(vertices[..., 0], -1, axis=-1) * vertices[..., 1], axis=-1)
+    normals = np.stack([edges[..., 1], -edges[..., 0]], axis=-1) * np.sign(area)[..., None, None]
+
+    # per line and edge, n . (o + t d - v) <= 0 inside: (n, k) arrays
+    direction = np.broadcast_to(direction, origins.shape)
+    denom = np.sum(normals * direction[:, None, :], axis=-1)
+    numer = np.sum(normals * (origins[:, None, :] - vertices), axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = -numer / denom
+    entering = denom < 0
+    exiting = denom > 0
+    t_lo = np.max(np.where(entering, t, -reach), axis=-1, initial=-reach)
+    t_hi = np.min(np.where(exiting, t, reach), axis=-1, initial=reach)
+    # lines parallel to an edge and outside it miss the polygon
+    parallel_outside = np.any(~entering & ~exiting & (numer > 0), axis=-1)
+    valid = (t_lo < t_hi) & ~parallel_outside
+    return _endpoints(origins, direction, t_lo, t_hi), valid
+
+
+def clip_circle(origins, direction, center, radius, reach=reach):
+    """Endpoints and mask of lines clipped against a circle (center and radius may be per line)"""
+    origins = np.asarray(origins, dtype=float)
+    direction = np.broadcast_to(direction, origins.shape)
+    f = origins - center
+    a = np.sum(direction * direction, axis=-1)
+    b = np.sum(f * direction, axis=-1)
+    c = np.sum(f * f, axis=-1) - np.asarray(radius) ** 2
+    disc = b ** 2 - a * c
+    root = np.sqrt(np.maximum(disc, 0))
+    t_lo = np.maximum((-b - root) / a, -reach)
+    t_hi = np.minimum((-b + root) / a, reach)
+    return _endpoints(origins, direction, t_lo, t_hi), (disc > 0) & (t_lo < t_hi)
+
+
+def _endpoints(origins, direction, t_lo, t_hi):
+    return origins[:, None, :] + np.stack([t_lo, t_hi], axis=-1)[..., None] * direction[..., None, :]
+
+
+def shape_stripes(is_triangle, line_direction, pos, size=0.1):
+    """(m, 2, 2) endpoints of the stripes that cross one flanker2.py shape"""
+    origins, direction = stripe_family(pos, line_direction)
+    if is_triangle:
+        endpoints, valid = clip_polygon(origins, direction, triangle_vertices(size) + pos)
+    else:
+        endpoints, valid = clip_circle(origins, direction, np.asarray(pos, dtype=float), size)
+    return endpoints[valid]
+
+
+def display_stripes(shapes, size=0.1):
+    """Stripes of a whole display clipped in one pass.
+
+    shapes is a sequence of (is_triangle, line_direction, pos). Returns the
+    (m, 2, 2) endpoints of every stripe that crosses its shape and the index
+    of that shape for each.
+    """
+    angles = np.array([stripe_angles[line_direction] for _, line_direction, _ in shapes])
+    centers = np.array([pos for _, _, pos in shapes], dtype=float)
+    is_triangle = np.array([shape[0] for shape in shapes], dtype=bool)
+    direction = np.column_stack([np.cos(angles), np.sin(angles)])
+    perp = np.column_stack([-direction[:, 1], direction[:, 0]])
+    offsets = (np.arange(n_stripes) - n_stripes / 2 + 0.5) * stripe_spacing
+    # clipping is done around each shape's center, so every triangle is the same polygon
+    origins = (offsets[None, :, None] * perp[:, None, :]).reshape(-1, 2)
+    direction = np.repeat(direction, n_stripes, axis=0)
+    shape_index = np.repeat(np.arange(len(shapes)), n_stripes)
+
+    # both clips for every line is cheaper than splitting the lines by shape
+    polygon, polygon_valid = clip_polygon(origins, direction, triangle_vertices(size))
+    circle, circle_valid = clip_circle(origins, direction, 0, size)
+    triangle_line = is_triangle[shape_index]
+    endpoints = np.where(triangle_line[:, None, None], polygon, circle) + centers[shape_index, None, :]
+    valid = np.where(triangle_line, polygon_valid, circle_valid)
+    return endpoints[valid], shape_index[valid]
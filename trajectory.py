@@ -0,0 +1,87 @@
+import csv
+import os
+
+import numpy as np
+
+sample_dtype = np.dtype('<f4')
+index_fields = ('trial', 'offset', 'n_samples', 'n_dropped')
+
+
+class TrajectoryBuffer:
+    """Fixed-size ring buffer of (time, x, y) samples.
+
+    The storage is allocated once; adding a sample writes three floats in
+    place, and past capacity the oldest samples are overwritten.
+    """
+
+    def __init__(self, capacity=4096):
+        self.samples = np.zeros((capacity, 3))
+        self.capacity = capacity
+        self.n_samples = 0
+
+    def clear(self):
+        self.n_samples = 0
+
+    def add(self, t, x, y):
+        i = self.n_samples % self.capacity
+        samples = self.samples
+        samples[i, 0] = t
+        samples[i, 1] = x
+        samples[i, 2] = y
+        self.n_samples += 1
+
+    @property
+    def n_dropped(self):
+        return max(0, self.n_samples - self.capacity)
+
+    def ordered(self):
+        """Samples kept, oldest first"""
+        if self.n_samples <= self.capacity:
+            return self.samples[:self.n_samples]
+        start = self.n_samples % self.capacity
+        return np.concatenate([self.samples[start:], self.samples[:start]])
+
+
+class TrajectoryFile:
+    """Appends each trial's samples to path.bin as float32 rows, indexed in path.idx.
+
+    The index is CSV, but not named .csv, so that session file globs such as
+    WCST_*.csv do not pick it up. Existing files are never overwritten: if
+    either name is taken, path_1, path_2 and so on are tried, and self.path
+    is the one used.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        n = 1
+        while os.path.exists(self.path + '.bin') or os.path.exists(self.path + '.idx'):
+            self.path = f"{path}_{n}"
+            n += 1
+        self.data_path = self.path + '.bin'
+        self.index_path = self.path + '.idx'
+        self._data = open(self.data_path, 'xb')
+        self._index_file = open(self.index_path, 'x', newline='')
+        self._index = csv.writer(self._index_file)
+        self._index.writerow(index_fields)
+        self.offset = 0
+
+    def write(self, trial, buffer):
+        samples = buffer.ordered().astype(sample_dtype)
+        self._data.write(samples.tobytes())
+        self._index.writerow((trial, self.offset, len(samples), buffer.n_dropped))
+        self.offset += len(samples)
+        self._data.flush()
+        self._index_file.flush()
+
+    def close(self):
+        self._data.close()
+        self._index_file.close()
+
+
+def load_trajectories(path):
+    """Trial number to (n, 3) time, x, y array, from a TrajectoryFile"""
+    samples = np.fromfile(path + '.bin', dtype=sample_dtype).reshape(-1, 3)
+    with open(path + '.idx', newline='') as f:
+        rows = list(csv.DictReader(f))
+    return {int(row['trial']): samples[int(row['offset']):int(row['offset']) + int(row['n_samples'])]
+            for row in rows}
@@ -0,0 +1,99 @@
+import numpy as np
+import pyglet
+from psychopy.tools.monitorunittools import convertToPix
+
+GL = pyglet.gl
+
+
+class TriangleBatch:
+    """Any number of colored triangles drawn with one glDrawArrays call.
+
+    Vertices are given in the window's units, three rows per triangle, and
+    colors as one RGBA row (0:1 range) per vertex.
+    """
+
+    def __init__(self, win, vertices=None, colors=None, units=None):
+        self.win = win
+        self.units = units or win.units
+        self.n_draws = 0
+        self.set_vertices(np.zeros((0, 2)) if vertices is None else vertices,
+                          np.zeros((0, 4)) if colors is None else colors)
+
+    def set_vertices(self, vertices, colors):
+        vertices = np.asarray(vertices, dtype=float).reshape(-1, 2)
+        colors = np.asarray(colors, dtype=float).reshape(-1, 4)
+        if len(vertices) != len(colors):
+            raise ValueError(f"{len(vertices)} vertices but {len(colors)} colors")
+        self._vertices_pix = np.ascontiguousarray(
+            convertToPix(vertices, (0, 0), self.units, self.win), dtype=np.float64)
+        self._colors = np.ascontiguousarray(colors, dtype=np.float64)
+
+    def draw(self):
+        n_verts = len(self._vertices_pix)
+        if not n_verts:
+            return
+        win = self.win
+        win._setCurrent()
+        if win._haveShaders:
+            GL.glUseProgram(win._progSignedFrag)
+        GL.glPushMatrix()
+        win.setScale('pix')
+        # unbind textures, which would otherwise modulate the vertex colors
+        GL.glActiveTexture(GL.GL_TEXTURE0)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+        GL.glActiveTexture(GL.GL_TEXTURE1)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+
+        GL.glVertexPointer(2, GL.GL_DOUBLE, 0, self._vertices_pix.ctypes)
+        GL.glColorPointer(4, GL.GL_DOUBLE, 0, self._colors.ctypes)
+        GL.glEnableClientState(GL.GL_VERTEX_ARRAY)
+        GL.glEnableClientState(GL.GL_COLOR_ARRAY)
+        GL.glDrawArrays(GL.GL_TRIANGLES, 0, n_verts)
+        GL.glDisableClientState(GL.GL_COLOR_ARRAY)
+        GL.glDisableClientState(GL.GL_VERTEX_ARRAY)
+
+        GL.glPopMatrix()
+        if win._haveShaders:
+            GL.glUseProgram(0)
+        self.n_draws += 1
+
+
+def line_quads(starts, ends, widths):
+    """(6 * n, 2) vertices of two triangles per line, for pixel endpoints and widths"""
+    along = ends - starts
+    length = np.maximum(np.hypot(along[:, 0], along[:, 1]), 1e-12)
+    half = np.column_stack([-along[:, 1], along[:, 0]]) * (np.asarray(widths) / (2 * length))[:, None]
+    corners = np.stack([starts - half, starts + half, ends + half,
+                        starts - half, ends + half, ends - half], axis=1)
+    return corners.reshape(-1, 2)
+
+
+class LineBatch:
+    """Any number of lines drawn as quads with one TriangleBatch draw call.
+
+    Endpoints are given in the window's units as an (n, 2, 2) array, widths
+    in pixels as for lineWidth, and colors as RGBA rows (0:1 range), one per
+    line or one for all; widths may also be one for all.
+    """
+
+    def __init__(self, win, endpoints=None, widths=1, colors=(0, 0, 0, 1), units=None):
+        self.win = win
+        self.units = units or win.units
+        self.batch = TriangleBatch(win, units='pix')
+        if endpoints is not None:
+            self.set_lines(endpoints, widths, colors)
+
+    @property
+    def n_draws(self):
+        return self.batch.n_draws
+
+    def set_lines(self, endpoints, widths=1, colors=(0, 0, 0, 1)):
+        endpoints = np.asarray(endpoints, dtype=float).reshape(-1, 2)
+        pix = convertToPix(endpoints, (0, 0), self.units, self.win).reshape(-1, 2, 2)
+        n_lines = len(pix)
+        widths = np.broadcast_to(np.asarray(widths, dtype=float), (n_lines,))
+        colors = np.broadcast_to(np.asarray(colors, dtype=float).reshape(-1, 4), (n_lines, 4))
+        self.batch.set_vertices(line_quads(pix[:, 0], pix[:, 1], widths), np.repeat(colors, 6, axis=0))
+
+    def draw(self):
+        self.batch.draw()
@@ -0,0 +1,125 @@
+"""Build display-ready WCST card textures.
+
+    python wcst_assets.py [--size 256]
+
+Each card image in Wisconsin_Material is downscaled to a square
+power-of-two RGBA array and saved as .npy in Wisconsin_Material/prepared,
+named after the source file's content hash. manifest.json maps each image
+to its hash and array so that only changed images are rebuilt.
+"""
+import argparse
+import hashlib
+import json
+import os
+
+import numpy as np
+from PIL import Image
+
+manifest_name = 'manifest.json'
+
+
+def content_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def prepare_image(img, size):
+    img = img.convert('RGBA').resize((size, size), Image.LANCZOS)
+    # PsychoPy takes numpy textures bottom row first
+    return np.ascontiguousarray(np.flipud(np.asarray(img, dtype=np.uint8)))
+
+
+def to_texture(pixels):
+    return pixels.astype(np.float32) * (2 / 255) - 1
+
+
+def load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, manifest_name)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'size': None, 'images': {}}
+
+
+def build_assets(source_dir, out_dir, size=256):
+    if size & (size - 1):
+        raise ValueError(f"texture size must be a power of two, not {size}")
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = load_manifest(out_dir)
+    if manifest.get('size') != size:
+        manifest = {'size': size, 'images': {}}
+
+    images = {}
+    built = []
+    for name in sorted(os.listdir(source_dir)):
+        if not name.lower().endswith(('.jpg', '.jpeg', '.png')):
+            continue
+        path = os.path.join(source_dir, name)
+        stat = os.stat(path)
+        digest = content_hash(path)
+        array_name = f"{digest}.npy"
+        entry = manifest['images'].get(name)
+        if not (entry and entry['sha1'] == digest
+                and os.path.exists(os.path.join(out_dir, array_name))):
+            with Image.open(path) as img:
+                np.save(os.path.join(out_dir, array_name), prepare_image(img, size))
+            built.append(name)
+        images[name] = {'sha1': digest, 'array': array_name,
+                        'mtime_ns': stat.st_mtime_ns, 'bytes': stat.st_size}
+
+    in_use = {entry['array'] for entry in images.values()}
+    for name in os.listdir(out_dir):
+        if name.endswith('.npy') and name not in in_use:
+            os.remove(os.path.join(out_dir, name))
+
+    manifest = {'size': size, 'images': images}
+    tmp_path = os.path.join(out_dir, manifest_name + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, os.path.join(out_dir, manifest_name))
+    return built
+
+
+class PreparedAssets:
+    """Looks up prebuilt card arrays, skipping any whose source has changed"""
+
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        manifest = load_manifest(out_dir)
+        self.size = manifest['size']
+        self.images = manifest['images']
+
+    def lookup(self, path):
+        entry = self.images.get(os.path.basename(path))
+        if entry is None:
+            return None
+        stat = os.stat(path)
+        # an unchanged size and mtime saves hashing the source
+        if ((stat.st_mtime_ns, stat.st_size) != (entry['mtime_ns'], entry['bytes'])
+                and content_hash(path) != entry['sha1']):
+            return None
+        array_path = os.path.join(self.out_dir, entry['array'])
+        return array_path if os.path.exists(array_path) else None
+
+    def load(self, path):
+        array_path = self.lookup(path)
+        if array_path is None:
+            return None
+        return to_texture(np.load(array_path, mmap_mode='r'))
+
+
+if __name__ == '__main__':
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Build display-ready WCST card textures")
+    parser.add_argument('--source', default=os.path.join(script_dir, 'Wisconsin_Material'))
+    parser.add_argument('--out', default=None,
+                        help="output folder (default: <source>/prepared)")
+    parser.add_argument('--size', type=int, default=256,
+                        help="edge length of the square textures in pixels")
+    args = parser.parse_args()
+    out_dir = args.out or os.path.join(args.source, 'prepared')
+    built = build_assets(args.source, out_dir, args.size)
+    print(f"{len(built)} card textures rebuilt in {out_dir}")
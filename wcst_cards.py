@@ -0,0 +1,284 @@
+import csv
+import os
+import random
+import struct
+import sys
+import zlib
+from array import array
+from itertools import permutations, product
+
+rules = ('color', 'shape', 'number')
+shapes = ('triangle', 'circle', 'star', 'cross')
+colors = ('green', 'red', 'blue', 'yellow')
+# the four reference card positions, left to right
+response_keys = ('card1', 'card2', 'card3', 'card4')
+
+
+class Card:
+    """Immutable attribute record for one card image"""
+    __slots__ = ('image_num', 'number', 'shape', 'color')
+
+    def __init__(self, image_num, number, shape, color):
+        object.__setattr__(self, 'image_num', image_num)
+        object.__setattr__(self, 'number', number)
+        object.__setattr__(self, 'shape', shape)
+        object.__setattr__(self, 'color', color)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Card records are read-only")
+
+    def __getitem__(self, key):
+        # cards used to be plain dicts, so keep card['color'] working
+        return getattr(self, key)
+
+    def __repr__(self):
+        return f"Card({self.image_num}, {self.number}, {self.shape!r}, {self.color!r})"
+
+
+class CardTable:
+    """Card records plus inverted indexes from each attribute value to cards"""
+
+    def __init__(self, cards):
+        self.cards = {card.image_num: card for card in cards}
+        self.image_nums = tuple(self.cards)
+
+        index = {rule: {} for rule in rules}
+        for card in self.cards.values():
+            for rule in rules:
+                index[rule].setdefault(card[rule], []).append(card.image_num)
+        self.index = {rule: {value: tuple(nums) for value, nums in values.items()}
+                      for rule, values in index.items()}
+
+    def __getitem__(self, image_num):
+        return self.cards[image_num]
+
+    def __len__(self):
+        return len(self.cards)
+
+
+def standard_card(image_num):
+    number = (image_num - 1) % 4 + 1
+    group = (image_num - 1) // 16
+    color_group = ((image_num - 1) % 16) // 4
+    return Card(image_num, number, shapes[group], colors[color_group])
+
+
+def standard_deck():
+    return CardTable([standard_card(num) for num in range(1, 65)])
+
+
+def load_deck(index_path, images=True):
+    """Read a deck index file with image, color, shape and number columns.
+
+    Cards are numbered from 1 in file order. Returns the card table and a
+    dict of image paths, resolved relative to the index file. With images
+    False the image column is not needed and the dict is empty.
+    """
+    folder = os.path.dirname(os.path.abspath(index_path))
+    cards = []
+    image_paths = {}
+    with open(index_path, newline='') as f:
+        reader = csv.DictReader(f)
+        missing = ({'image', *rules} if images else set(rules)) - set(reader.fieldnames or ())
+        if missing:
+            raise ValueError(f"{index_path} has no {', '.join(sorted(missing))} column")
+        for num, row in enumerate(reader, start=1):
+            cards.append(Card(num, int(row['number']), row['shape'], row['color']))
+            if images:
+                image_paths[num] = os.path.join(folder, row['image'])
+    return CardTable(cards), image_paths
+
+
+# every way of laying out four cards on the four response positions
+orders = tuple(permutations(range(4)))
+rule_bits = (1, 2, 4)
+
+
+def match_mask(card, other):
+    return sum(bit for bit, rule in zip(rule_bits, rules) if card[rule] == other[rule])
+
+
+def deck_signature(deck):
+    text = ';'.join(f"{num},{deck[num].color},{deck[num].shape},{deck[num].number}"
+                    for num in deck.image_nums)
+    return zlib.crc32(text.encode('utf-8'))
+
+
+def distinct_cards(cards):
+    return all(len({card[rule] for card in cards}) == len(cards) for rule in rules)
+
+
+def valid_reference_sets(deck, image_num):
+    """Every valid four-card reference set for one target card.
+
+    As with the standard WCST reference cards, the four cards differ from
+    each other in color, shape and number, and each rule is matched by
+    exactly one of them. Returns one sorted list per ambiguity tag: tag 0
+    sets match each rule with a different card, tag 1 sets have one card
+    matching the target on two rules.
+    """
+    card = deck[image_num]
+    by_mask = {mask: [] for mask in range(8)}
+    for num in deck.image_nums:
+        if num != image_num:
+            by_mask[match_mask(card, deck[num])].append(deck[num])
+
+    tagged = ([], [])
+    groups = [(0, (1, 2, 4, 0)), (1, (3, 4, 0, 0)), (1, (5, 2, 0, 0)), (1, (6, 1, 0, 0))]
+    for tag, masks in groups:
+        for cards in product(*(by_mask[mask] for mask in masks)):
+            if distinct_cards(cards):
+                tagged[tag].append(tuple(sorted(c.image_num for c in cards)))
+    # the two non-matching cards of a tag 1 set come out in both orders
+    return [sorted(set(sets)) for sets in tagged]
+
+
+def check_reference_set(deck, image_num, refs):
+    card = deck[image_num]
+    if image_num in refs or not distinct_cards([deck[num] for num in refs]):
+        return False
+    masks = [match_mask(card, deck[num]) for num in refs]
+    return all(sum(1 for mask in masks if mask & bit) == 1 for bit in rule_bits)
+
+
+class ReferenceSetTable:
+    """Precomputed valid reference sets for every target card, grouped by ambiguity tag.
+
+    On disk the table is a small header, a table of record offsets per target
+    and tag, and one byte per card position for each set.
+    """
+    magic = b'WCRS'
+    version = 1
+    n_tags = 2
+
+    def __init__(self, deck, offsets, records):
+        self.deck = deck
+        self.positions = {num: i for i, num in enumerate(deck.image_nums)}
+        self.offsets = offsets
+        self.records = records
+
+    @classmethod
+    def build(cls, deck):
+        if len(deck) > 256:
+            raise ValueError("reference set tables store card positions in one byte; "
+                             f"a deck of {len(deck)} cards is too large")
+        positions = {num: i for i, num in enumerate(deck.image_nums)}
+        offsets = array('I')
+        records = array('B')
+        for num in deck.image_nums:
+            for tagged in valid_reference_sets(deck, num):
+                offsets.append(len(records) // 4)
+                for refs in tagged:
+                    records.extend(positions[ref] for ref in refs)
+        offsets.append(len(records) // 4)
+        return cls(deck, offsets, records)
+
+    @classmethod
+    def load(cls, path, deck):
+        with open(path, 'rb') as f:
+            magic, version, n_cards, n_tags, signature = struct.unpack('<4sHHHI', f.read(14))
+            if magic != cls.magic or version != cls.version:
+                raise ValueError(f"{path} is not a reference set table")
+            if n_cards != len(deck) or n_tags != cls.n_tags or signature != deck_signature(deck):
+                raise ValueError(f"{path} was built for a different deck")
+            offsets = array('I')
+            offsets.fromfile(f, n_cards * n_tags + 1)
+            records = array('B')
+            records.fromfile(f, offsets[-1] * 4)
+        if sys.byteorder != 'little':
+            offsets.byteswap()
+        return cls(deck, offsets, records)
+
+    def save(self, path):
+        offsets = array('I', self.offsets)
+        if sys.byteorder != 'little':
+            offsets.byteswap()
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(struct.pack('<4sHHHI', self.magic, self.version, len(self.deck),
+                                self.n_tags, deck_signature(self.deck)))
+            offsets.tofile(f)
+            self.records.tofile(f)
+        os.replace(tmp_path, path)
+
+    def count(self, image_num, tag):
+        i = self.positions[image_num] * self.n_tags + tag
+        return self.offsets[i + 1] - self.offsets[i]
+
+    def get(self, image_num, tag, index):
+        i = self.offsets[self.positions[image_num] * self.n_tags + tag] + index
+        return [self.deck.image_nums[pos] for pos in self.records[i * 4:i * 4 + 4]]
+
+    def draw(self, image_num, max_tag=0, rng=random):
+        """Draw one valid set uniformly, already laid out in a random card order"""
+        first = self.offsets[self.positions[image_num] * self.n_tags]
+        last = self.offsets[self.positions[image_num] * self.n_tags + max_tag + 1]
+        if last == first:
+            raise ValueError(f"no valid reference set found for card {image_num}")
+        pick = rng.randrange((last - first) * len(orders))
+        i = first + pick // len(orders)
+        refs = self.records[i * 4:i * 4 + 4]
+        return [self.deck.image_nums[refs[pos]] for pos in orders[pick % len(orders)]]
+
+    def verify(self):
+        for num in self.deck.image_nums:
+            for tag in range(self.n_tags):
+                for index in range(self.count(num, tag)):
+                    refs = self.get(num, tag, index)
+                    if not check_reference_set(self.deck, num, refs):
+                        raise ValueError(f"invalid reference set {refs} for card {num}")
+
+
+class ReferenceSampler:
+    """Draws valid tag 0 reference sets by rejection sampling the attribute indexes.
+
+    For decks too large to enumerate every set in advance. Each try takes
+    one card per rule from that rule's index plus one card from the whole
+    deck, so any set that passes check_reference_set is unambiguous.
+    """
+
+    def __init__(self, deck, max_tries=10000):
+        self.deck = deck
+        self.max_tries = max_tries
+
+    def draw(self, image_num, max_tag=0, rng=random):
+        card = self.deck[image_num]
+        for _ in range(self.max_tries):
+            refs = [rng.choice(self.deck.index[rule][card[rule]]) for rule in rules]
+            refs.append(rng.choice(self.deck.image_nums))
+            if check_reference_set(self.deck, image_num, refs):
+                rng.shuffle(refs)
+                return refs
+        raise ValueError(f"no valid reference set found for card {image_num}")
+
+
+def load_reference_sets(path, deck, max_table_cards=64):
+    """Load the prebuilt table, rebuilding it if it is missing or for another deck.
+
+    Decks with more than max_table_cards cards take too long to enumerate
+    and get a ReferenceSampler instead.
+    """
+    try:
+        return ReferenceSetTable.load(path, deck)
+    except (OSError, ValueError, EOFError, struct.error):
+        if len(deck) > max_table_cards:
+            return ReferenceSampler(deck)
+        table = ReferenceSetTable.build(deck)
+        try:
+            table.save(path)
+        except OSError:
+            pass
+        return table
+
+
+if __name__ == '__main__':
+    import time
+
+    out_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'Wisconsin_Material', 'reference_sets.bin')
+    start = time.perf_counter()
+    table = ReferenceSetTable.build(standard_deck())
+    table.verify()
+    table.save(out_path)
+    print(f"{len(table.records) // 4} reference sets written to {out_path} "
+          f"in {time.perf_counter() - start:.1f} s")
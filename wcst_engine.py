@@ -0,0 +1,240 @@
+"""Display-free WCST rule engine and simulated participants.
+
+    python wcst_engine.py [--sessions 10000] [--trials 128] [--seed 0] [--scored 1000]
+
+SortingEngine is the rule-switching state of one session, as used by
+wisconsinsorting.py. BatchSortingEngine runs the same rules over many
+sessions at once on numpy arrays, with trials drawn from a reference set
+table and responses from the simulated agents below, so that whole cohorts
+of sessions can be generated to check the deck, the reference sets and the
+scoring code.
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from wcst_cards import load_reference_sets, match_mask, orders, rule_bits, rules, standard_deck
+
+rule_bit_array = np.array(rule_bits)
+
+
+class SortingEngine:
+    """Current rule and run of correct sorts for one session"""
+
+    def __init__(self, rule=None, switch_after=10, rng=random):
+        self.rng = rng
+        self.switch_after = switch_after
+        self.current_rule = rule or rng.choice(rules)
+        self.correct_in_row = 0
+        self.rule_changes = 0
+
+    def correct_answer(self, bottom_card, top_cards):
+        bit = rule_bits[rules.index(self.current_rule)]
+        for i, card in enumerate(top_cards):
+            if match_mask(bottom_card, card) & bit:
+                return i
+        raise ValueError(f"no reference card matches card {bottom_card['image_num']} by {self.current_rule}")
+
+    def respond(self, correct):
+        """Record one sort; returns whether the rule changed after it"""
+        self.correct_in_row = self.correct_in_row + 1 if correct else 0
+        if self.correct_in_row < self.switch_after:
+            return False
+        self.current_rule = self.rng.choice([r for r in rules if r != self.current_rule])
+        self.correct_in_row = 0
+        self.rule_changes += 1
+        return True
+
+
+class TrialSampler:
+    """Draws bottom cards and reference sets for many sessions at once"""
+
+    def __init__(self, table, max_tag=0):
+        deck = table.deck
+        self.deck = deck
+        self.max_tag = max_tag
+        self.image_nums = np.array(deck.image_nums)
+        offsets = np.array(table.offsets).reshape(-1)
+        self.first = offsets[:-1:table.n_tags]
+        self.last = offsets[max_tag + 1::table.n_tags]
+        # every set in every card order, so one lookup draws a laid out set
+        records = np.frombuffer(table.records, dtype=np.uint8).reshape(-1, 4)
+        self.layouts = records[:, np.array(orders)].reshape(-1, 4)
+        self.masks = np.array([[match_mask(deck[a], deck[b]) for b in deck.image_nums]
+                               for a in deck.image_nums], dtype=np.uint8)
+
+    def sample(self, shape, rng):
+        """Bottom card and reference card positions in the deck, and match masks"""
+        bottom = rng.integers(len(self.image_nums), size=shape)
+        first = self.first[bottom] * len(orders)
+        refs = self.layouts[rng.integers(first, self.last[bottom] * len(orders))]
+        return bottom, refs, self.masks[bottom[..., None], refs]
+
+
+class RandomAgent:
+    def __init__(self, n_sessions, rng):
+        self.n_sessions = n_sessions
+        self.rng = rng
+
+    def choose(self, masks):
+        return self.rng.integers(4, size=self.n_sessions)
+
+    def update(self, chosen_masks, correct):
+        pass
+
+
+class PerseverativeAgent:
+    """Guesses until a sort is rewarded, then sorts by that rule for good"""
+
+    def __init__(self, n_sessions, rng):
+        self.rng = rng
+        self.rule = np.full(n_sessions, -1)
+
+    def choose(self, masks):
+        guess = self.rng.integers(3, size=len(self.rule))
+        rule = np.where(self.rule >= 0, self.rule, guess)
+        return np.argmax((masks & rule_bit_array[rule][:, None]) != 0, axis=1)
+
+    def update(self, chosen_masks, correct):
+        # with tag 1 sets a rewarded card can match on several rules; the
+        # lowest one is kept
+        rewarded = correct & (self.rule < 0)
+        first_rule = np.argmax((chosen_masks[:, None] & rule_bit_array) != 0, axis=1)
+        self.rule = np.where(rewarded, first_rule, self.rule)
+
+
+class OptimalAgent:
+    """Keeps the set of rules consistent with the feedback so far.
+
+    Sorts by the first candidate rule, drops the rules an error rules out
+    and, when every candidate has been ruled out (the rule has changed),
+    starts again from the rules the last card did not match.
+    """
+
+    def __init__(self, n_sessions, rng):
+        self.candidates = np.ones((n_sessions, 3), dtype=bool)
+
+    def choose(self, masks):
+        rule = np.argmax(self.candidates, axis=1)
+        return np.argmax((masks & rule_bit_array[rule][:, None]) != 0, axis=1)
+
+    def update(self, chosen_masks, correct):
+        matched = (chosen_masks[:, None] & rule_bit_array) != 0
+        consistent = np.where(correct[:, None], matched, ~matched)
+        narrowed = self.candidates & consistent
+        self.candidates = np.where(narrowed.any(axis=1)[:, None], narrowed, consistent)
+
+
+agents = {'random': RandomAgent, 'perseverative': PerseverativeAgent, 'optimal': OptimalAgent}
+
+
+class BatchSortingEngine:
+    """SortingEngine over many sessions, one array element per session"""
+
+    def __init__(self, n_sessions, switch_after=10, rng=None):
+        self.rng = rng or np.random.default_rng()
+        self.switch_after = switch_after
+        self.rule = self.rng.integers(3, size=n_sessions)
+        self.correct_in_row = np.zeros(n_sessions, dtype=np.int64)
+        self.rule_changes = np.zeros(n_sessions, dtype=np.int64)
+
+    def respond(self, chosen_masks):
+        """Score one sort per session from the chosen cards' match masks"""
+        correct = (chosen_masks & rule_bit_array[self.rule]) != 0
+        self.correct_in_row = np.where(correct, self.correct_in_row + 1, 0)
+        changed = self.correct_in_row >= self.switch_after
+        self.rule = np.where(changed, (self.rule + self.rng.integers(1, 3, size=len(self.rule))) % 3,
+                             self.rule)
+        self.correct_in_row[changed] = 0
+        self.rule_changes += changed
+        return correct, changed
+
+
+def simulate_sessions(sampler, agent, n_sessions, n_trials=128, switch_after=10, seed=None):
+    """Run n_sessions complete sessions with one agent class.
+
+    Returns (sessions, trials) arrays: rule index, bottom and reference card
+    deck positions, reference match masks, chosen card, whether it was
+    correct, its match mask and whether the rule changed after the trial.
+    """
+    rng = np.random.default_rng(seed)
+    engine = BatchSortingEngine(n_sessions, switch_after, rng)
+    player = agent(n_sessions, rng)
+    # filled a trial at a time, so trials are the leading axis until the end
+    bottom, refs, masks = sampler.sample((n_trials, n_sessions), rng)
+    shape = (n_trials, n_sessions)
+    result = {
+        'rule': np.empty(shape, dtype=np.int64),
+        'choice': np.empty(shape, dtype=np.int64),
+        'correct': np.empty(shape, dtype=bool),
+        'response_match': np.empty(shape, dtype=np.uint8),
+        'rule_changed': np.empty(shape, dtype=bool),
+    }
+    sessions = np.arange(n_sessions)
+    for t in range(n_trials):
+        choice = player.choose(masks[t])
+        chosen_masks = masks[t, sessions, choice]
+        result['rule'][t] = engine.rule
+        correct, changed = engine.respond(chosen_masks)
+        player.update(chosen_masks, correct)
+        result['choice'][t] = choice
+        result['correct'][t] = correct
+        result['response_match'][t] = chosen_masks
+        result['rule_changed'][t] = changed
+    result = {name: values.T for name, values in result.items()}
+    result.update(bottom=bottom.T, refs=refs.transpose(1, 0, 2), masks=masks.transpose(1, 0, 2))
+    return result
+
+
+def check_sessions(result, switch_after=10, max_tag=0):
+    """Raise ValueError if simulated sessions break the task's invariants"""
+    masks = result['masks']
+    if max_tag == 0 and np.any(np.sort(masks, axis=-1) != np.array([0, 1, 2, 4])):
+        raise ValueError("a reference set does not match the bottom card once on each rule")
+    if np.any(masks.sum(axis=-1) == 0):
+        raise ValueError("a reference set has no card matching the bottom card")
+    if np.any(result['bottom'][..., None] == result['refs']):
+        raise ValueError("a reference card repeats the bottom card")
+    rule_bit = rule_bit_array[result['rule']]
+    if np.any(result['correct'] != ((result['response_match'] & rule_bit) != 0)):
+        raise ValueError("correct does not agree with the rule and the chosen card")
+    changed_rule = result['rule'][:, 1:] != result['rule'][:, :-1]
+    if np.any(changed_rule != result['rule_changed'][:, :-1]):
+        raise ValueError("the rule changed without a completed category")
+    # a category is completed by exactly switch_after correct sorts in a row
+    for s, t in zip(*np.nonzero(result['rule_changed'])):
+        if t + 1 < switch_after or not result['correct'][s, t + 1 - switch_after:t + 1].all():
+            raise ValueError(f"session {s} changed rule after trial {t} too early")
+
+
+if __name__ == '__main__':
+    import os
+
+    from wcst_scoring import score_session
+
+    parser = argparse.ArgumentParser(description="Simulate and check WCST sessions without a display")
+    parser.add_argument('--sessions', type=int, default=10000)
+    parser.add_argument('--trials', type=int, default=128)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--scored', type=int, default=1000, help="sessions per agent to run through wcst_scoring")
+    args = parser.parse_args()
+
+    deck = standard_deck()
+    table_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Wisconsin_Material',
+                              'reference_sets.bin')
+    sampler = TrialSampler(load_reference_sets(table_path, deck))
+    for name, agent in agents.items():
+        start = time.perf_counter()
+        result = simulate_sessions(sampler, agent, args.sessions, args.trials, seed=args.seed)
+        elapsed = time.perf_counter() - start
+        check_sessions(result)
+        for s in range(min(args.sessions, args.scored)):
+            scores = score_session(result['rule'][s], result['correct'][s], result['rule_changed'][s],
+                                   result['response_match'][s])
+            if scores['categories_completed'] != result['rule_changed'][s].sum():
+                raise ValueError(f"{name} session {s}: scored categories disagree with the engine")
+        print(f"{name:>13}: {args.sessions / elapsed:,.0f} sessions/s, "
+              f"{result['correct'].mean():.1%} correct, "
+              f"{result['rule_changed'].sum(axis=1).mean():.2f} categories per session")
@@ -0,0 +1,167 @@
+"""Sequential learning model fits for WCST sessions (Bishara et al., 2010).
+
+    python wcst_model.py data [--out wcst_model_fits.csv] [--workers 4]
+
+Attention weights a over (color, shape, number) start equal. On each trial
+card k is chosen with probability proportional to (m_k . a) ** d, where m_k
+marks the rules card k matches the bottom card on. After feedback the
+weights move towards a signal s by r after a correct response and by p after
+an error; s is the chosen card's matched rules (correct) or the rules it did
+not match (error), weighted by a ** f and normalised.
+
+The likelihood is evaluated for a whole batch of parameter sets at once and,
+given the weights, over all trials at once. Fits start from the best of a
+batch of random starting points and refine the few best with L-BFGS-B.
+Sessions need the card1_match..card4_match and response columns written by
+wisconsinsorting.py.
+"""
+import argparse
+import csv
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from batchfit import fit_starts
+from wcst_cards import rule_bits
+from wcst_scoring import read_session as read_scoring_session
+
+param_names = ('r', 'p', 'd', 'f')
+bounds = np.array([[0.0, 1.0], [0.0, 1.0], [0.01, 5.0], [0.01, 5.0]])
+rule_bit_array = np.array(rule_bits)
+# small lapse rate, so that choosing a card that matches nothing is not
+# impossible under the model
+lapse = 1e-3
+eps = 1e-12
+
+
+def masks_to_matches(masks):
+    """(trials, 4) rule bit masks to (trials, 4, 3) match indicators"""
+    return (np.asarray(masks)[..., None] & rule_bit_array) > 0
+
+
+def attention_history(params, matches, choices, correct):
+    """Attention weights before each trial, shape (sets, trials, 3)"""
+    params = np.atleast_2d(params)
+    r, p, f = params[:, 0:1], params[:, 1:2], params[:, 3:4]
+    n_sets, n_trials = len(params), len(choices)
+    a = np.full((n_sets, 3), 1 / 3)
+    history = np.empty((n_sets, n_trials, 3))
+    for t in range(n_trials):
+        history[:, t] = a
+        if choices[t] < 0:
+            continue
+        chosen = matches[t, choices[t]]
+        target = chosen if correct[t] else ~chosen
+        weighted = target * a ** f
+        s = weighted / np.maximum(weighted.sum(axis=1, keepdims=True), eps)
+        rate = r if correct[t] else p
+        a = (1 - rate) * a + rate * s
+        a = np.maximum(a, eps)
+    return history
+
+
+def log_likelihood(params, matches, choices, correct):
+    """Log-likelihood of a session for each parameter set in a batch"""
+    params = np.atleast_2d(params)
+    history = attention_history(params, matches, choices, correct)
+    responded = choices >= 0
+    # support for every card on every trial: (sets, trials, cards)
+    support = np.einsum('tkj,ntj->ntk', matches[responded].astype(float), history[:, responded])
+    support = np.maximum(support, eps) ** params[:, 2, None, None]
+    probs = support / support.sum(axis=2, keepdims=True)
+    chosen = probs[:, np.arange(responded.sum()), choices[responded]]
+    return np.log((1 - lapse) * chosen + lapse / 4).sum(axis=1)
+
+
+def fit_session(matches, choices, correct, n_starts=200, n_refine=3, seed=0):
+    rng = np.random.default_rng(seed)
+    starts = bounds[:, 0] + rng.random((n_starts, 4)) * (bounds[:, 1] - bounds[:, 0])
+    best = fit_starts(lambda params: log_likelihood(params, matches, choices, correct), starts, bounds, n_refine)
+    fit = dict(zip(param_names, best.x))
+    fit.update(log_likelihood=-best.fun, n_trials=int((choices >= 0).sum()))
+    return fit
+
+
+def simulate_session(params, n_trials=128, switch_after=10, seed=None):
+    """Trial sequence of a simulated participant following the model.
+
+    Every reference set has one card matching the bottom card on each rule
+    and one matching nothing, in random order, like the tag 0 sets used by
+    wisconsinsorting.py.
+    """
+    rng = np.random.default_rng(seed)
+    r, p, d, f = params
+    base = np.array([1, 2, 4, 0])
+    masks = np.array([rng.permutation(base) for _ in range(n_trials)])
+    matches = masks_to_matches(masks)
+    choices = np.empty(n_trials, dtype=int)
+    correct = np.empty(n_trials, dtype=bool)
+    a = np.full(3, 1 / 3)
+    rule = rng.integers(3)
+    in_row = 0
+    for t in range(n_trials):
+        support = np.maximum(matches[t] @ a, eps) ** d
+        probs = (1 - lapse) * support / support.sum() + lapse / 4
+        choices[t] = rng.choice(4, p=probs / probs.sum())
+        chosen = matches[t, choices[t]]
+        correct[t] = chosen[rule]
+        target = chosen if correct[t] else ~chosen
+        weighted = target * a ** f
+        s = weighted / max(weighted.sum(), eps)
+        rate = r if correct[t] else p
+        a = np.maximum((1 - rate) * a + rate * s, eps)
+        in_row = in_row + 1 if correct[t] else 0
+        if in_row >= switch_after:
+            rule = (rule + rng.integers(1, 3)) % 3
+            in_row = 0
+    return matches, choices, correct
+
+
+def read_session(path):
+    """(matches, choices, correct) of a session file, or None without card match columns"""
+    session = read_scoring_session(path)
+    if session is None or 'card_match' not in session:
+        return None
+    return masks_to_matches(session['card_match']), session['choice'], session['correct']
+
+
+def fit_file(path):
+    session = read_session(path)
+    if session is None:
+        return None
+    fit = fit_session(*session)
+    fit['file'] = os.path.basename(path)
+    return fit
+
+
+def fit_sessions(sessions, workers=None):
+    """Fit (matches, choices, correct) sessions in parallel, in order"""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_fit_args, sessions))
+
+
+def _fit_args(session):
+    return fit_session(*session)
+
+
+def fit_directory(data_dir, pattern='WCST_*.csv', workers=None):
+    paths = sorted(glob.glob(os.path.join(data_dir, pattern)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return [fit for fit in pool.map(fit_file, paths) if fit is not None]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fit the sequential learning model to WCST sessions")
+    parser.add_argument('data_dir', nargs='?', default='data')
+    parser.add_argument('--pattern', default='WCST_*.csv')
+    parser.add_argument('--out', default='wcst_model_fits.csv')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+    fits = fit_directory(args.data_dir, args.pattern, args.workers)
+    with open(args.out, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=('file',) + param_names + ('log_likelihood', 'n_trials'))
+        writer.writeheader()
+        writer.writerows(fits)
+    print(f"{len(fits)} sessions fitted into {args.out}")
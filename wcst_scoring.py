@@ -0,0 +1,194 @@
+"""Heaton-style scores for the WCST sessions written by wisconsinsorting.py.
+
+    python wcst_scoring.py data [--out wcst_scores.csv] [--workers 4]
+
+Each session file is scored with array operations over its trials, files
+are spread over a process pool, and scores are cached next to the data in
+.wcst_scores.json so that only new or changed files are scored again.
+
+Scores follow Heaton et al. (1993) with the perseverated-to principle taken
+as the rule of the previous category; no principle is set before the first
+category is completed. Perseverative scores need the response_match column
+(bit mask of the rules the chosen card matched: color 1, shape 2, number 4)
+and are left empty for sessions recorded without it.
+"""
+import argparse
+import csv
+import glob
+import hashlib
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from wcst_cards import response_keys, rule_bits, rules
+
+rule_bit_array = np.array(rule_bits)
+cache_name = '.wcst_scores.json'
+score_names = ('trials', 'correct', 'errors', 'categories_completed',
+               'trials_to_first_category', 'perseverative_responses',
+               'perseverative_errors', 'nonperseverative_errors',
+               'percent_perseverative_errors', 'failures_to_maintain_set',
+               'conceptual_level_responses', 'percent_conceptual_level_responses')
+
+
+def read_session(path):
+    with open(path, newline='') as f:
+        rows = [row for row in csv.DictReader(f) if row.get('current_rule')]
+    if not rows:
+        return None
+    session = {
+        'rule': np.array([rules.index(row['current_rule']) for row in rows]),
+        'correct': np.array([row['correct'] == 'True' for row in rows]),
+        'rule_changed': np.array([row['rule_changed'] == 'True' for row in rows]),
+        'participant': rows[0].get('participant', ''),
+        'session': rows[0].get('session', ''),
+    }
+    if 'response_match' in rows[0]:
+        session['response_match'] = np.array(
+            [int(float(row['response_match'])) if row['response_match'] not in ('', 'None') else 0
+             for row in rows])
+    if 'card1_match' in rows[0]:
+        # rule bit masks of the four reference cards, and the card chosen (-1 for none)
+        session['card_match'] = np.array([[int(float(row[f'{key}_match'])) for key in response_keys]
+                                          for row in rows])
+        session['choice'] = np.array([response_keys.index(row['response']) if row['response'] in response_keys
+                                      else -1 for row in rows])
+    return session
+
+
+def score_session(rule, correct, rule_changed, response_match=None):
+    """Heaton scores for one session from per-trial arrays"""
+    n = len(correct)
+    idx = np.arange(n)
+    # category of each trial: how many categories were completed before it
+    category = np.concatenate([[0], np.cumsum(rule_changed)[:-1]]).astype(int)
+    starts_category = np.concatenate([[False], rule_changed[:-1]])
+
+    # length of the current run of correct responses, reset by errors and
+    # by the start of a new category
+    breaks = np.where(~correct, idx, np.where(starts_category, idx - 1, -1))
+    last_break = np.maximum.accumulate(breaks)
+    run = np.where(correct, idx - last_break, 0)
+
+    previous_run = np.concatenate([[0], run[:-1]])
+    failures_to_maintain_set = int(np.sum(~correct & (previous_run >= 5) & ~starts_category))
+
+    run_id = np.cumsum(~correct | starts_category)
+    run_total = np.bincount(run_id, weights=correct)
+    conceptual = correct & (run_total[run_id] >= 3)
+
+    changed_at = np.flatnonzero(rule_changed)
+    scores = {
+        'trials': n,
+        'correct': int(correct.sum()),
+        'errors': int(n - correct.sum()),
+        'categories_completed': len(changed_at),
+        'trials_to_first_category': int(changed_at[0] + 1) if len(changed_at) else math.nan,
+        'failures_to_maintain_set': failures_to_maintain_set,
+        'conceptual_level_responses': int(conceptual.sum()),
+        'percent_conceptual_level_responses': float(100 * conceptual.sum() / n),
+    }
+
+    if response_match is None:
+        for name in ('perseverative_responses', 'perseverative_errors',
+                     'nonperseverative_errors', 'percent_perseverative_errors'):
+            scores[name] = math.nan
+        return scores
+
+    # the rule in force on the trial that completed each category; -1 where
+    # no category has been completed yet
+    previous_rule = np.full(n, -1)
+    if len(changed_at):
+        completed_rule = rule[changed_at]
+        previous_rule = np.where(category > 0, completed_rule[np.maximum(category - 1, 0)], -1)
+    perseverative = (previous_rule >= 0) & (
+        (response_match & rule_bit_array[np.maximum(previous_rule, 0)]) != 0)
+    perseverative_errors = int(np.sum(perseverative & ~correct))
+    scores.update({
+        'perseverative_responses': int(perseverative.sum()),
+        'perseverative_errors': perseverative_errors,
+        'nonperseverative_errors': scores['errors'] - perseverative_errors,
+        'percent_perseverative_errors': 100 * perseverative_errors / n,
+    })
+    return scores
+
+
+def score_file(path):
+    session = read_session(path)
+    if session is None:
+        return None
+    scores = score_session(session['rule'], session['correct'], session['rule_changed'],
+                           session.get('response_match'))
+    scores.update(file=os.path.basename(path), participant=session['participant'],
+                  session=session['session'])
+    return scores
+
+
+def file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def score_directory(data_dir, pattern='WCST_*.csv', workers=None):
+    """Score every matching session file, reusing cached scores for unchanged files"""
+    cache_path = os.path.join(data_dir, cache_name)
+    try:
+        with open(cache_path) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+
+    results = {}
+    stale = []
+    for path in sorted(glob.glob(os.path.join(data_dir, pattern))):
+        name = os.path.basename(path)
+        stat = os.stat(path)
+        entry = cache.get(name)
+        if entry and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+            results[name] = entry['scores']
+            continue
+        digest = file_hash(path)
+        if entry and entry['sha1'] == digest:
+            entry.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+            results[name] = entry['scores']
+            continue
+        stale.append((path, {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha1': digest}))
+
+    if stale:
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunksize = max(1, len(stale) // (4 * workers))
+            scored = pool.map(score_file, [path for path, _ in stale], chunksize=chunksize)
+            for (path, entry), scores in zip(stale, scored):
+                name = os.path.basename(path)
+                cache[name] = dict(entry, scores=scores)
+                results[name] = scores
+
+    cache = {name: entry for name, entry in cache.items() if name in results}
+    tmp_path = cache_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(cache, f)
+    os.replace(tmp_path, cache_path)
+    return [results[name] for name in sorted(results) if results[name] is not None]
+
+
+def write_scores(scores, path):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=('file', 'participant', 'session') + score_names)
+        writer.writeheader()
+        writer.writerows(scores)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Score WCST session files")
+    parser.add_argument('data_dir', nargs='?', default='data')
+    parser.add_argument('--pattern', default='WCST_*.csv')
+    parser.add_argument('--out', default='wcst_scores.csv')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+    scores = score_directory(args.data_dir, args.pattern, args.workers)
+    write_scores(scores, args.out)
+    print(f"{len(scores)} sessions scored into {args.out}")
@@ -0,0 +1,139 @@
+import queue
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+from psychopy import visual
+
+from wcst_assets import prepare_image, to_texture
+
+
+class CardTextureCache:
+    """Decodes and uploads card images once, then reuses the textures.
+
+    Decoding runs on a background thread that works through the cards asked
+    for by prefetch. Textures can only be created on the thread that owns the
+    window, so decoded cards are uploaded by pump, which the task calls while
+    it waits for input.
+
+    Cards found in a PreparedAssets build are read straight from their
+    arrays; any others are decoded and downscaled to the same texture size.
+    With a memory_budget (in bytes) the least recently used textures are
+    released once the budget is reached. The budget has to hold the cards of
+    one trial and of the lookahead trials prefetched after it, or cards
+    would be decoded again on every redraw.
+    """
+
+    cards_per_trial = 5
+
+    def __init__(self, win, image_paths, progress=None, prepared=None, texture_size=256,
+                 memory_budget=None, lookahead=0):
+        self.win = win
+        self.image_paths = dict(image_paths)
+        self.progress = progress
+        self.prepared = prepared
+        self.texture_size = prepared.size if prepared and prepared.size else texture_size
+        self.memory_budget = memory_budget
+        min_cards = min(self.cards_per_trial * (lookahead + 1), len(self.image_paths))
+        if memory_budget is not None and self.capacity < min_cards:
+            raise ValueError(f"a texture memory budget of {memory_budget} bytes holds {self.capacity} cards; "
+                             f"{min_cards} cards need {min_cards * self.texture_bytes} bytes")
+        self.stims = OrderedDict()
+        self.n_uploaded = 0
+        self.n_evicted = 0
+        self._pending = set()
+        self._requests = queue.Queue()
+        self._decoded = queue.Queue()
+        self._loader = None
+
+    @property
+    def texture_bytes(self):
+        # PsychoPy keeps image textures as RGBA float32
+        return self.texture_size ** 2 * 16
+
+    @property
+    def capacity(self):
+        if self.memory_budget is None:
+            return len(self.image_paths)
+        return self.memory_budget // self.texture_bytes
+
+    @property
+    def memory_used(self):
+        return len(self.stims) * self.texture_bytes
+
+    def _decode_requests(self):
+        while True:
+            num = self._requests.get()
+            path = self.image_paths[num]
+            try:
+                texture = self.prepared.load(path) if self.prepared else None
+                if texture is None:
+                    with Image.open(path) as img:
+                        texture = to_texture(prepare_image(img, self.texture_size))
+                self._decoded.put((num, texture))
+            except Exception as err:
+                self._decoded.put((num, err))
+
+    def prefetch(self, nums):
+        if self._loader is None:
+            self._loader = threading.Thread(target=self._decode_requests, daemon=True)
+            self._loader.start()
+        for num in nums:
+            if num in self.stims:
+                # cards about to be shown count as recently used
+                self.stims.move_to_end(num)
+            elif num not in self._pending:
+                if num not in self.image_paths:
+                    raise KeyError(f"No card image for card {num}")
+                self._pending.add(num)
+                self._requests.put(num)
+
+    def start_prefetch(self):
+        # a deck larger than the budget is only loaded as the schedule needs it
+        if len(self.image_paths) <= self.capacity:
+            self.prefetch(self.image_paths)
+
+    def pump(self, block=False, max_items=None):
+        uploaded = 0
+        while max_items is None or uploaded < max_items:
+            try:
+                num, image = self._decoded.get(block=block)
+            except queue.Empty:
+                break
+            self._pending.discard(num)
+            if isinstance(image, Exception):
+                raise OSError(f"Could not load card image {self.image_paths[num]}") from image
+            self.stims[num] = visual.ImageStim(self.win, image=image)
+            self.n_uploaded += 1
+            uploaded += 1
+            self._evict()
+            if self.progress:
+                self.progress(self.n_uploaded, self.n_uploaded + len(self._pending))
+        return uploaded
+
+    def _evict(self):
+        while len(self.stims) > self.capacity:
+            num, stim = self.stims.popitem(last=False)
+            stim.clearTextures()
+            self.n_evicted += 1
+
+    def finish(self):
+        while self._pending:
+            self.pump(block=True, max_items=1)
+
+    def get(self, num):
+        if num in self.stims:
+            self.stims.move_to_end(num)
+            return self.stims[num]
+        self.prefetch([num])
+        while num not in self.stims:
+            self.pump(block=True, max_items=1)
+        return self.stims[num]
+
+    def draw(self, num, pos, size):
+        # the same card can appear twice on one screen, so the stim is
+        # moved and drawn straight away rather than kept per position
+        stim = self.get(num)
+        stim.pos = pos
+        stim.size = size
+        stim.draw()
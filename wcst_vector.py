@@ -0,0 +1,145 @@
+import math
+
+import numpy as np
+from psychopy import colors as psychopy_colors
+
+from vertexbatch import TriangleBatch
+
+
+def regular_outline(n_points, start_angle=90):
+    angles = np.radians(start_angle + np.arange(n_points) * 360 / n_points)
+    return np.column_stack([np.cos(angles), np.sin(angles)])
+
+
+def star_outline(n_points=5, inner=0.45):
+    outline = regular_outline(2 * n_points)
+    outline[1::2] *= inner
+    return outline
+
+
+def cross_outline(arm=0.35):
+    a = arm
+    return np.array([[a, a], [a, 1], [-a, 1], [-a, a], [-1, a], [-1, -a],
+                     [-a, -a], [-a, -1], [a, -1], [a, -a], [1, -a], [1, a]])
+
+
+# unit-radius outlines, all star-shaped around the origin so they can be
+# filled as a triangle fan from the centre
+shape_outlines = {
+    'triangle': regular_outline(3),
+    'circle': regular_outline(40),
+    'star': star_outline(),
+    'cross': cross_outline(),
+    'square': regular_outline(4, 45) * math.sqrt(2) * 0.8,
+    'diamond': regular_outline(4),
+    'hexagon': regular_outline(6),
+}
+
+card_palette = {
+    'green': (0.0, 0.6, 0.2, 1.0),
+    'red': (0.85, 0.1, 0.1, 1.0),
+    'blue': (0.1, 0.25, 0.85, 1.0),
+    'yellow': (0.95, 0.8, 0.0, 1.0),
+}
+
+
+def fan_triangles(outline):
+    nxt = np.roll(outline, -1, axis=0)
+    tris = np.empty((len(outline), 3, 2))
+    tris[:, 0] = 0
+    tris[:, 1] = outline
+    tris[:, 2] = nxt
+    return tris.reshape(-1, 2)
+
+
+def rect_triangles(left, bottom, right, top):
+    return np.array([[left, bottom], [right, bottom], [right, top],
+                     [left, bottom], [right, top], [left, top]], dtype=float)
+
+
+def item_layout(count):
+    """Centres and radius of `count` items on a card spanning -0.5:0.5"""
+    layouts = {
+        1: [(0, 0)],
+        2: [(-0.2, 0.2), (0.2, -0.2)],
+        3: [(-0.25, 0.25), (0, 0), (0.25, -0.25)],
+        4: [(-0.2, 0.2), (0.2, 0.2), (-0.2, -0.2), (0.2, -0.2)],
+    }
+    if count in layouts:
+        return np.array(layouts[count], dtype=float), 0.15
+    cols = math.ceil(math.sqrt(count))
+    rows = math.ceil(count / cols)
+    step = 0.8 / cols
+    centres = [((i % cols - (cols - 1) / 2) * step, ((rows - 1) / 2 - i // cols) * step)
+               for i in range(count)]
+    return np.array(centres, dtype=float), step * 0.4
+
+
+def resolve_color(color):
+    if color in card_palette:
+        return card_palette[color]
+    return tuple(psychopy_colors.Color(color).rgba1)
+
+
+def card_geometry(card, border=0.03):
+    """Triangles and per-vertex colors for one card, in card units (-0.5:0.5)"""
+    parts = [rect_triangles(-0.5, -0.5, 0.5, 0.5)]
+    part_colors = [(1, 1, 1, 1)]
+    for edge in ((-0.5, -0.5, 0.5, -0.5 + border), (-0.5, 0.5 - border, 0.5, 0.5),
+                 (-0.5, -0.5, -0.5 + border, 0.5), (0.5 - border, -0.5, 0.5, 0.5)):
+        parts.append(rect_triangles(*edge))
+        part_colors.append((0, 0, 0, 1))
+
+    item = fan_triangles(shape_outlines[card.shape])
+    centres, radius = item_layout(card.number)
+    fill = resolve_color(card.color)
+    for centre in centres:
+        parts.append(item * radius + centre)
+        part_colors.append(fill)
+
+    vertices = np.concatenate(parts)
+    vertex_colors = np.concatenate([np.tile(color, (len(part), 1))
+                                    for part, color in zip(parts, part_colors)])
+    return vertices, vertex_colors
+
+
+class VectorCardRenderer:
+    """Draws cards from their attributes instead of from image files.
+
+    Each card is one triangle batch, so drawing a card is one draw call. It
+    has the same drawing interface as CardTextureCache; the loading hooks
+    only have to build the geometry.
+    """
+
+    def __init__(self, win, deck):
+        for num in deck.image_nums:
+            if deck[num].shape not in shape_outlines:
+                raise ValueError(f"card {num} has shape {deck[num].shape!r}, which has no vector outline")
+        self.win = win
+        self.deck = deck
+        self.geometry = {}
+        self.batch = TriangleBatch(win)
+
+    def start_prefetch(self):
+        for num in self.deck.image_nums:
+            self.get(num)
+
+    def prefetch(self, nums):
+        for num in nums:
+            self.get(num)
+
+    def pump(self, block=False, max_items=None):
+        return 0
+
+    def finish(self):
+        self.start_prefetch()
+
+    def get(self, num):
+        if num not in self.geometry:
+            self.geometry[num] = card_geometry(self.deck[num])
+        return self.geometry[num]
+
+    def draw(self, num, pos, size):
+        vertices, vertex_colors = self.get(num)
+        self.batch.set_vertices(vertices * size + pos, vertex_colors)
+        self.batch.draw()
@@ -1,6 +1,13 @@
-from psychopy import visual, core, event, gui, data
+from psychopy import visual, core, event, gui, data, logging
 import random
 import os
+from stimregistry import StimulusRegistry
+from trajectory import TrajectoryBuffer, TrajectoryFile
+from wcst_assets import PreparedAssets
+from wcst_cards import load_deck, load_reference_sets, match_mask, response_keys, standard_deck
+from wcst_engine import SortingEngine
+from wcst_textures import CardTextureCache
+from wcst_vector import VectorCardRenderer
 
 info_dlg = gui.Dlg(title="Wisconsin Card Sorting Task")
 info_dlg.addText("Participant Info")
@@ -24,344 +31,308 @@ this_exp = data.ExperimentHandler(name='WCST', version='1.0',
 
 win = visual.Window([1024, 768], monitor="testMonitor", units="norm", fullscr=False, color='white')
 
-rules = ['color', 'shape', 'number']
-current_rule = random.choice(rules)
-correct_in_row = 0
-rule_changes = 0
+sorting = SortingEngine()
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
 wisconsin_path = os.path.join(script_dir, "Wisconsin_Material")
-all_images = list(range(1, 65))
+# a deck index has image, color, shape and number columns
+deck_index = os.path.join(wisconsin_path, "deck.csv")
+texture_memory_mb = 256
+lookahead_trials = 3
+n_trials = 128
+# draw the cards from their attributes instead of from image files; the
+# vector deck index has color, shape and number columns and no images
+use_vector_cards = False
+vector_deck_index = os.path.join(script_dir, "vector_deck.csv")
+
+if use_vector_cards:
+    if os.path.exists(vector_deck_index):
+        deck, image_paths = load_deck(vector_deck_index, images=False)
+    else:
+        deck, image_paths = standard_deck(), {}
+    reference_sets_path = os.path.splitext(vector_deck_index)[0] + "_reference_sets.bin"
+elif os.path.exists(deck_index):
+    deck, image_paths = load_deck(deck_index)
+    reference_sets_path = os.path.join(wisconsin_path, "reference_sets.bin")
+else:
+    deck = standard_deck()
+    image_paths = {num: os.path.join(wisconsin_path, f"{num}.jpg") for num in deck.image_nums}
+    reference_sets_path = os.path.join(wisconsin_path, "reference_sets.bin")
+all_images = list(deck.image_nums)
 
 def get_card_properties(image_num):
-    number = (image_num - 1) % 4 + 1
-    group = (image_num - 1) // 16
-    color_group = ((image_num - 1) % 16) // 4
-    shapes = ['triangle', 'circle', 'star', 'cross']
-    colors = ['green', 'red', 'blue', 'yellow']
-    return {'number': number, 'shape': shapes[group], 'color': colors[color_group], 'image_num': image_num}
+    return deck[image_num]
 
 def get_image_path(num):
-    return os.path.join(wisconsin_path, f"{num}.jpg")
+    return image_paths[num]
+
+def report_card_progress(loaded, total):
+    logging.info(f"WCST card textures ready: {loaded}/{total}")
 
-missing_files = []
-for num in all_images:
-    if not os.path.exists(get_image_path(num)):
-        missing_files.append(get_image_path(num))
+# cards are loaded in the background while the instructions are up, from
+# the wcst_assets.py build where it is up to date
+if use_vector_cards:
+    card_textures = VectorCardRenderer(win, deck)
+else:
+    card_textures = CardTextureCache(win, image_paths,
+                                     progress=report_card_progress,
+                                     prepared=PreparedAssets(os.path.join(wisconsin_path, "prepared")),
+                                     memory_budget=texture_memory_mb * 1024 ** 2,
+                                     lookahead=lookahead_trials)
+card_textures.start_prefetch()
+reference_sets = load_reference_sets(reference_sets_path, deck)
 
-if missing_files:
-    error_msg = "Missing image files:\n" + "\n".join(missing_files)
-    raise FileNotFoundError(error_msg)
+def wait_for_space():
+    event.clearEvents('keyboard')
+    while not event.getKeys(keyList=['space']):
+        card_textures.pump(max_items=1)
+        core.wait(0.005)
 
 instructions = [
     "Wisconsin Card Sorting",
     "In this next task, you will need to classify cards in base of their number of items, the shape of their items, or the color of their items\n\nPress space bar to continue"
 ]
+remaining_instructions = [
+    "You will have to figure out the classification rule by trial and error.\nFeedback will be provided after each selection\n\nPress space bar to continue",
+    "The classification rule can change at any point during the task\nYou will complete a total of 128 trials\nPress space bar to continue",
+    "When ready, press the space bar to start"
+]
+final_text = "Thank you\nThis task is now finished\n\nPress space bar to continue"
+
+example_target = 12
+example_refs = [25, 2, 55, 48]
+option_positions = [(-0.45, 0.4), (-0.15, 0.4), (0.15, 0.4), (0.45, 0.4)]
+# instruction text, arrow end, arrow head orientation and explanation
+rule_examples = [
+    ("If you want to sort it by color, you should select the first card", (-0.45, 0.3), 45, "Both are blue"),
+    ("If you want to sort it by shape, you should select the second card", (-0.15, 0.3), 45, "Both are triangles"),
+    ("If you want to sort it by number of items, you should select the last card", (0.45, 0.3), -45, "Both have 4 items"),
+]
+feedback_styles = {
+    'correct': ("Correct", 'green'),
+    'incorrect': ("Incorrect", 'red'),
+    'no response': ("No response", 'orange'),
+}
+
+# every text and shape the task shows is built once, before the trials
+stimuli = StimulusRegistry(win)
+for i, instr in enumerate(instructions + remaining_instructions):
+    stimuli.define(f'instructions_{i}', visual.TextStim, text=instr, height=0.06, wrapWidth=1.8, color='black')
+stimuli.define('example_text', visual.TextStim,
+               text="Here you can find an example. The card you need to classify is placed on the bottom",
+               pos=(0, 0.8), height=0.05, color='black')
+for i, (text, end, ori, explanation) in enumerate(rule_examples):
+    stimuli.define(f'rule_{i}_text', visual.TextStim, text=text, pos=(0, 0.8), height=0.06, color='black')
+    stimuli.define(f'rule_{i}_line', visual.Line, start=(0, -0.2), end=end, lineWidth=3, lineColor='red')
+    stimuli.define(f'rule_{i}_arrow_head', visual.Polygon, edges=3, radius=0.03, pos=end, ori=ori,
+                   fillColor='red', lineColor='red')
+    stimuli.define(f'rule_{i}_explanation', visual.TextStim, text=explanation, pos=(0, 0), height=0.05,
+                   color='black')
+for response_type, (feedback, color) in feedback_styles.items():
+    stimuli.define(f'feedback_{response_type}', visual.TextStim, text=feedback, height=0.1, color=color)
+stimuli.define('prompt', visual.TextStim, text="Click on the correct card", pos=(0, 0.7), height=0.05, color='black')
+stimuli.define('final_text', visual.TextStim, text=final_text, height=0.08, color='black')
+stimuli.build_all()
 
 def select_reference_cards(bottom_card):
-    color_matches = []
-    shape_matches = []
-    number_matches = []
-    
-    for num in all_images:
-        if num == bottom_card['image_num']:
-            continue
-        props = get_card_properties(num)
-        if props['color'] == bottom_card['color']:
-            color_matches.append(num)
-        if props['shape'] == bottom_card['shape']:
-            shape_matches.append(num)
-        if props['number'] == bottom_card['number']:
-            number_matches.append(num)
-    
-    selected = []
-    if color_matches:
-        selected.append(random.choice(color_matches))
-    if shape_matches:
-        selected.append(random.choice(shape_matches))
-    if number_matches:
-        selected.append(random.choice(number_matches))
-    
-    while len(selected) < 4:
-        remaining = [num for num in all_images if num != bottom_card['image_num'] and num not in selected]
-        if not remaining:
-            break
-        selected.append(random.choice(remaining))
-    
-    matches = 0
-    for num in selected:
-        props = get_card_properties(num)
-        if (props['color'] == bottom_card['color'] or 
-            props['shape'] == bottom_card['shape'] or 
-            props['number'] == bottom_card['number']):
-            matches += 1
-    
-    if matches < 2:
-        for i in range(len(selected)):
-            props = get_card_properties(selected[i])
-            if not (props['color'] == bottom_card['color'] or 
-                   props['shape'] == bottom_card['shape'] or 
-                   props['number'] == bottom_card['number']):
-                for rule in ['color', 'shape', 'number']:
-                    if rule == 'color' and color_matches:
-                        selected[i] = random.choice(color_matches)
-                        break
-                    elif rule == 'shape' and shape_matches:
-                        selected[i] = random.choice(shape_matches)
-                        break
-                    elif rule == 'number' and number_matches:
-                        selected[i] = random.choice(number_matches)
-                        break
-    
-    return selected[:4]
+    return reference_sets.draw(bottom_card['image_num'])
+
+def draw_example_cards():
+    for num, pos in zip(example_refs, option_positions):
+        card_textures.draw(num, pos, (0.2, 0.3))
+    card_textures.draw(example_target, (0, -0.3), (0.25, 0.35))
 
 def show_example_trial():
-    example_target = get_card_properties(12) 
-    example_refs = [25, 2, 55, 48]  
-    
-    text = visual.TextStim(win, text="Here you can find an example. The card you need to classify is placed on the bottom",
-                         pos=(0, 0.8), height=0.05, color='black')
-    text.draw()
-    
-    option_positions = [(-0.45, 0.4), (-0.15, 0.4), (0.15, 0.4), (0.45, 0.4)]
-    for i, num in enumerate(example_refs):
-        img = visual.ImageStim(win, image=get_image_path(num), 
-                             pos=option_positions[i], size=(0.2, 0.3))
-        img.draw()
-
-    target_img = visual.ImageStim(win, image=get_image_path(example_target['image_num']),
-                                pos=(0, -0.3), size=(0.25, 0.35))
-    target_img.draw()
-    
+    stimuli.draw('example_text')
+    draw_example_cards()
     win.flip()
-    event.waitKeys(keyList=['space'])
+    wait_for_space()
 
 def show_matching_rules():
-    example_target = get_card_properties(12)  
-    example_refs = [25, 2, 55, 48] 
-    
-    text = visual.TextStim(win, text="If you want to sort it by color, you should select the first card", 
-                         pos=(0, 0.8), height=0.06, color='black')
-    text.draw()
-    
-    option_positions = [(-0.45, 0.4), (-0.15, 0.4), (0.15, 0.4), (0.45, 0.4)]
-    for i, num in enumerate(example_refs):
-        img = visual.ImageStim(win, image=get_image_path(num), 
-                             pos=option_positions[i], size=(0.2, 0.3))
-        img.draw()
-    
-    target_img = visual.ImageStim(win, image=get_image_path(example_target['image_num']),
-                                pos=(0, -0.3), size=(0.25, 0.35))
-    target_img.draw()
-    
-    line = visual.Line(win, start=(0, -0.2), end=(-0.45, 0.3), lineWidth=3, lineColor='red')
-    line.draw()
-    arrow_head = visual.Polygon(win, edges=3, radius=0.03, pos=(-0.45, 0.3), ori=45, fillColor='red', lineColor='red')
-    arrow_head.draw()
-    expl_text = visual.TextStim(win, text="Both are blue", pos=(0, 0), height=0.05, color='black')
-    expl_text.draw()
-    
-    win.flip()
-    event.waitKeys(keyList=['space'])
-    
-    text = visual.TextStim(win, text="If you want to sort it by shape, you should select the second card", 
-                         pos=(0, 0.8), height=0.06, color='black')
-    text.draw()
-    
-    for i, num in enumerate(example_refs):
-        img = visual.ImageStim(win, image=get_image_path(num), 
-                             pos=option_positions[i], size=(0.2, 0.3))
-        img.draw()
-    
-    target_img.draw()
-    
-    line = visual.Line(win, start=(0, -0.2), end=(-0.15, 0.3), lineWidth=3, lineColor='red')
-    line.draw()
-    arrow_head = visual.Polygon(win, edges=3, radius=0.03, pos=(-0.15, 0.3), ori=45, fillColor='red', lineColor='red')
-    arrow_head.draw()
-    expl_text = visual.TextStim(win, text="Both are triangles", pos=(0, 0), height=0.05, color='black')
-    expl_text.draw()
-    
-    win.flip()
-    event.waitKeys(keyList=['space'])
-    
-    text = visual.TextStim(win, text="If you want to sort it by number of items, you should select the last card", 
-                         pos=(0, 0.8), height=0.06, color='black')
-    text.draw()
-    
-    for i, num in enumerate(example_refs):
-        img = visual.ImageStim(win, image=get_image_path(num), 
-                             pos=option_positions[i], size=(0.2, 0.3))
-        img.draw()
-    
-    target_img.draw()
-    
-    line = visual.Line(win, start=(0, -0.2), end=(0.45, 0.3), lineWidth=3, lineColor='red')
-    line.draw()
-    arrow_head = visual.Polygon(win, edges=3, radius=0.03, pos=(0.45, 0.3), ori=-45, fillColor='red', lineColor='red')
-    arrow_head.draw()
-    expl_text = visual.TextStim(win, text="Both have 4 items", pos=(0, 0), height=0.05, color='black')
-    expl_text.draw()
-    
+    for i in range(len(rule_examples)):
+        stimuli.draw(f'rule_{i}_text')
+        draw_example_cards()
+        stimuli.draw(f'rule_{i}_line', f'rule_{i}_arrow_head', f'rule_{i}_explanation')
+        win.flip()
+        wait_for_space()
+
+def show_text_screen(name):
+    stimuli.draw(name)
     win.flip()
-    event.waitKeys(keyList=['space'])
+    wait_for_space()
 
 def show_instructions():
-    for instr in instructions:
-        text = visual.TextStim(win, text=instr, height=0.06, wrapWidth=1.8, color='black')
-        text.draw()
-        win.flip()
-        event.waitKeys(keyList=['space'])
+    for i in range(len(instructions)):
+        show_text_screen(f'instructions_{i}')
     
     show_example_trial()
     show_matching_rules()
     
-    remaining_instr = [
-        "You will have to figure out the classification rule by trial and error.\nFeedback will be provided after each selection\n\nPress space bar to continue",
-        "The classification rule can change at any point during the task\nYou will complete a total of 128 trials\nPress space bar to continue",
-        "When ready, press the space bar to start"
-    ]
-    for instr in remaining_instr:
-        text = visual.TextStim(win, text=instr, height=0.06, wrapWidth=1.8, color='black')
-        text.draw()
-        win.flip()
-        event.waitKeys(keyList=['space'])
+    for i in range(len(instructions), len(instructions) + len(remaining_instructions)):
+        show_text_screen(f'instructions_{i}')
 
 def show_feedback(response_type):
-    if response_type == 'correct':
-        feedback = "Correct"
-        color = 'green'
-    elif response_type == 'incorrect':
-        feedback = "Incorrect"
-        color = 'red'
-    else: 
-        feedback = "No response"
-        color = 'orange'
-    
-    text = visual.TextStim(win, text=feedback, height=0.1, color=color)
-    text.draw()
+    stimuli.draw(f'feedback_{response_type}')
     win.flip()
     core.wait(1.0)
 
-def draw_cards(bottom_card, top_cards):
-    win.flip()
-    visual.TextStim(win, text="Click on the correct card", pos=(0, 0.7), height=0.05, color='black').draw()
-    
-    for i, card in enumerate(top_cards):
-        pos = (-0.6 + i*0.4, 0.3)
-        img = visual.ImageStim(win, image=get_image_path(card['image_num']), pos=pos, size=(0.25, 0.35))
-        img.draw()
-    
-    bottom_img = visual.ImageStim(win, image=get_image_path(bottom_card['image_num']), pos=(0, -0.3), size=(0.3, 0.4))
-    bottom_img.draw()
+card_positions = [(-0.6 + i*0.4, 0.3) for i in range(4)]
+click_boxes = [(key, x - 0.15, x + 0.15, y - 0.2, y + 0.2)
+               for key, (x, y) in zip(response_keys, card_positions)]
+mouse = event.Mouse(win=win)
+response_clock = core.Clock()
+# one mouse sample per frame for up to 10 s at 240 Hz, kept in place and
+# written out after each trial to <data file>_mouse.bin with a .idx index,
+# numbered _1, _2, ... rather than overwriting an earlier run's files
+trajectory = TrajectoryBuffer(capacity=4096)
+trajectory_file = TrajectoryFile(filename + '_mouse')
+logging.info(f"WCST mouse trajectories: {trajectory_file.data_path}")
+
+def draw_trial_screen(bottom_card, top_cards):
+    stimuli.draw('prompt')
     
-    click_zones = {
-        'card1': visual.Rect(win, width=0.3, height=0.4, pos=(-0.6, 0.3), fillColor=None, lineColor=None),
-        'card2': visual.Rect(win, width=0.3, height=0.4, pos=(-0.2, 0.3), fillColor=None, lineColor=None),
-        'card3': visual.Rect(win, width=0.3, height=0.4, pos=(0.2, 0.3), fillColor=None, lineColor=None),
-        'card4': visual.Rect(win, width=0.3, height=0.4, pos=(0.6, 0.3), fillColor=None, lineColor=None)
-    }
+    for card, pos in zip(top_cards, card_positions):
+        card_textures.draw(card['image_num'], pos, (0.25, 0.35))
     
-    win.flip()
-    return click_zones
+    card_textures.draw(bottom_card['image_num'], (0, -0.3), (0.3, 0.4))
+
+def present_screen():
+    # RTs and click times count from the flip timestamp itself rather than
+    # from whenever the clocks would be reset after it
+    win.callOnFlip(mouse.clickReset)
+    onset = win.flip()
+    if onset is None:
+        onset = logging.defaultClock.getTime()
+    flip_time = onset + logging.defaultClock.getLastResetTime()
+    for clock in [response_clock] + event.mouseClick:
+        clock.add(flip_time - clock.getLastResetTime())
+    return onset
+
+def draw_cards(bottom_card, top_cards):
+    # the whole screen goes to the back buffer while the feedback is still
+    # up and is shown by a single flip
+    prep_start = core.getTime()
+    draw_trial_screen(bottom_card, top_cards)
+    prep_time = core.getTime() - prep_start
+    return prep_time, present_screen()
+
+def hit_card(pos):
+    x, y = pos
+    for key, left, right, bottom, top in click_boxes:
+        if left <= x <= right and bottom <= y <= top:
+            return key
+    return None
 
 def determine_correct_answer(bottom_card, top_cards):
-    if current_rule == 'color':
-        for i, card in enumerate(top_cards):
-            if bottom_card['color'] == card['color']:
-                return ['card1', 'card2', 'card3', 'card4'][i]
-    elif current_rule == 'shape':
-        for i, card in enumerate(top_cards):
-            if bottom_card['shape'] == card['shape']:
-                return ['card1', 'card2', 'card3', 'card4'][i]
-    else:
-        for i, card in enumerate(top_cards):
-            if bottom_card['number'] == card['number']:
-                return ['card1', 'card2', 'card3', 'card4'][i]
-    return 'card4'
+    return response_keys[sorting.correct_answer(bottom_card, top_cards)]
 
 def create_bottom_card():
     image_num = random.choice(all_images)
     return get_card_properties(image_num)
 
-def run_trial(trial_num):
-    global current_rule, correct_in_row, rule_changes
+def create_trial_cards():
     bottom_card = create_bottom_card()
     reference_image_nums = select_reference_cards(bottom_card)
-    top_cards = [get_card_properties(num) for num in reference_image_nums]
+    return bottom_card, [get_card_properties(num) for num in reference_image_nums]
+
+def schedule_cards(first, last):
+    nums = []
+    for bottom_card, top_cards in trial_schedule[first:last]:
+        nums.append(bottom_card['image_num'])
+        nums.extend(card['image_num'] for card in top_cards)
+    return nums
+
+def run_trial(trial_num):
+    bottom_card, top_cards = trial_schedule[trial_num - 1]
+    card_textures.prefetch(schedule_cards(trial_num, trial_num + lookahead_trials))
     
-    click_zones = draw_cards(bottom_card, top_cards)
+    prep_time, onset = draw_cards(bottom_card, top_cards)
     correct_answer = determine_correct_answer(bottom_card, top_cards)
     
     trial_data = {
         'trial_num': trial_num,
-        'bottom_image': f"{bottom_card['image_num']}.jpg",
+        'bottom_image': os.path.basename(get_image_path(bottom_card['image_num'])),
         'bottom_color': bottom_card['color'],
         'bottom_shape': bottom_card['shape'],
         'bottom_number': bottom_card['number'],
-        'current_rule': current_rule,
+        'current_rule': sorting.current_rule,
         'response': 'no response',
         'correct': False,
         'rt': None,
-        'correct_in_row': correct_in_row,
-        'rule_changed': False
+        'correct_in_row': sorting.correct_in_row,
+        'rule_changed': False,
+        'prep_time': prep_time,
+        'onset': onset
     }
+    # rules each card matches the bottom card on, as wcst_cards bit masks
+    # (color 1, shape 2, number 4), for scoring perseveration
+    card_matches = [match_mask(bottom_card, card) for card in top_cards]
+    for key, card, mask in zip(response_keys, top_cards, card_matches):
+        trial_data[f'{key}_image'] = os.path.basename(get_image_path(card['image_num']))
+        trial_data[f'{key}_match'] = mask
+    trial_data['response_match'] = None
     
     response = None
-    timer = core.Clock()
+    last_click = 0.0
+    trajectory.clear()
     
-    while timer.getTime() < 10:
+    while response_clock.getTime() < 10:
+        x, y = mouse.getPos()
+        trajectory.add(response_clock.getTime(), x, y)
+        
         if event.getKeys(['escape']):
             win.close()
             core.quit()
         
-        mouse = event.Mouse()
-        if mouse.getPressed()[0]:
-            mouse_pos = mouse.getPos()
-            for zone in click_zones:
-                if click_zones[zone].contains(mouse_pos):
-                    response = zone
-                    break
+        # press times are stamped by the mouse event handler (events are
+        # pumped on every flip) relative to the clickReset on the stimulus
+        # flip; a button still held down from the last trial reads as 0
+        buttons, times = mouse.getPressed(getTime=True)
+        if times[0] > last_click:
+            last_click = times[0]
+            response = hit_card((x, y))
             if response:
+                trial_data['rt'] = times[0]
                 break
         
-        core.wait(0.01)
+        card_textures.pump(max_items=1)
+        draw_trial_screen(bottom_card, top_cards)
+        win.flip()
     
     if response:
         trial_data['response'] = response
-        if response == correct_answer:
-            trial_data['correct'] = True
-            correct_in_row += 1
-            show_feedback('correct')
-        else:
-            trial_data['correct'] = False
-            correct_in_row = 0
-            show_feedback('incorrect')
-        
-        trial_data['rt'] = timer.getTime()
+        trial_data['response_match'] = card_matches[response_keys.index(response)]
+        trial_data['correct'] = response == correct_answer
+        trial_data['rule_changed'] = sorting.respond(trial_data['correct'])
+        show_feedback('correct' if trial_data['correct'] else 'incorrect')
     else:
+        # a missed trial leaves the run of correct sorts as it was
         show_feedback('no response')
     
-    if correct_in_row >= 10:
-        new_rules = [r for r in rules if r != current_rule]
-        current_rule = random.choice(new_rules)
-        correct_in_row = 0
-        rule_changes += 1
-        trial_data['rule_changed'] = True
-    
+    trajectory_file.write(trial_num, trajectory)
     for key, value in trial_data.items():
         this_exp.addData(key, value)
     this_exp.nextEntry()
 
+# the cards don't depend on the responses, so the whole session is drawn up
+# front and textures can be fetched a few trials before they are needed
+trial_schedule = [create_trial_cards() for _ in range(n_trials)]
+card_textures.prefetch(schedule_cards(0, lookahead_trials + 1))
+
 show_instructions()
+card_textures.finish()
 
-for trial_num in range(1, 129):
+stimuli.start_phase('trials')
+for trial_num in range(1, n_trials + 1):
     run_trial(trial_num)
+stimuli.start_phase('end')
+logging.info(f"WCST stimuli built during the trials: {stimuli.built_in('trials')}")
+if stimuli.built_in('trials') > 0:
+    logging.warning(f"{stimuli.built_in('trials')} WCST stimuli were built during the trials instead of up front")
 
-final_text = "Thank you\nThis task is now finished\n\nPress space bar to continue"
-text = visual.TextStim(win, text=final_text, height=0.08, color='black')
-text.draw()
+stimuli.draw('final_text')
 win.flip()
 event.waitKeys(keyList=['space'])
 
+trajectory_file.close()
 win.close()
\ No newline at end of file